@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Multi-filer get_metrics throughput with perf responses decoded by
+decode_perf_response on the polling threads (DecodePool(0)) and in
+DecodePool worker processes.
+
+Every filer is a ZapiSimulator running in its own process that
+replays cached responses, so the polling process only pays for the
+network I/O and the decoding.  Every filer gets one polling thread.
+The NetApp OnTAP API library must be importable (see NETAPP_LIB_PATH).
+
+    python benchmarks/bench_decode.py [filers] [instances] [rounds]
+
+Decoding on threads is capped at one core by the GIL; with a decode
+pool the throughput should grow with the number of processes up to
+the number of cores.
+'''
+
+import multiprocessing
+import os
+import sys
+import time
+
+from multiprocessing.pool import ThreadPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from netapp_metrics.decoder import DecodePool  # noqa: E402
+from netapp_metrics.netapp_metrics import NetAppMetrics  # noqa: E402
+from netapp_metrics.simulator import ZapiSimulator  # noqa: E402
+
+
+class ReplaySimulator(ZapiSimulator):
+    '''Answers a repeated request with the same response.'''
+
+    def __init__(self, *args, **kwargs):
+        ZapiSimulator.__init__(self, *args, **kwargs)
+        self._replies = {}
+
+    def handle(self, body):
+        if body not in self._replies:
+            self._replies[body] = ZapiSimulator.handle(self, body)
+        return self._replies[body]
+
+
+def serve(instances, ports, stop):
+    simulator = ReplaySimulator(instances=instances)
+    simulator.start()
+    ports.put(simulator.port)
+    stop.wait()
+    simulator.stop()
+
+
+def sweep(devices, rounds):
+    def poll(device):
+        netapp, instances = device
+        count = 0
+        for _ in range(rounds):
+            count += len(netapp.get_metrics('volume', instances)[0])
+        return count
+
+    pool = ThreadPool(len(devices))
+    start = time.time()
+    count = sum(pool.map(poll, devices))
+    elapsed = time.time() - start
+    pool.close()
+    return count / elapsed
+
+
+def main(filers, instances, rounds):
+    ports = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    servers = [
+        multiprocessing.Process(target=serve, args=(instances, ports, stop))
+        for _ in range(filers)
+    ]
+    for server in servers:
+        server.daemon = True
+        server.start()
+    ports = [ports.get() for _ in servers]
+    cores = multiprocessing.cpu_count()
+    print('%d filers x %d instances, %d rounds, %d cores' % (
+        filers, instances, rounds, cores))
+    processes = [0] + sorted(set([1, 2, 4, cores]))
+    for count in processes:
+        decode_pool = DecodePool(count)
+        devices = []
+        for port in ports:
+            netapp = NetAppMetrics(
+                '127.0.0.1', 'user', 'password', port=port, pool_size=1,
+                schema_cache=False, decode_pool=decode_pool)
+            devices.append((netapp, netapp.get_instances('volume')))
+        # Warm up the workers outside of the measurement.
+        devices[0][0].get_metrics('volume', devices[0][1][:1])
+        rate = sweep(devices, rounds)
+        label = '%d processes' % count if count else 'threads only'
+        print('%-14s %10.0f instances/s' % (label, rate))
+        for netapp, _ in devices:
+            netapp.close()
+        decode_pool.close()
+    stop.set()
+    for server in servers:
+        server.join()
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [4, 2000, 5][len(args):]))
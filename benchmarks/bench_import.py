@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Startup benchmark for netapp_metrics.
+
+Builds an increasing number of fake site-packages directories, puts them
+on PYTHONPATH and measures how long a fresh interpreter takes to import
+netapp_metrics.netapp_metrics and to locate the NetApp library with a
+warm location cache.  Import time should stay flat as the number of
+directories grows; the bare interpreter start-up with the same PYTHONPATH
+is shown for reference.
+
+    python benchmarks/bench_import.py [count ...]
+'''
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BASELINE = 'pass'
+IMPORT = 'import netapp_metrics.netapp_metrics'
+LOAD = ('import netapp_metrics.netapp_metrics as m; '
+        'm._load_naserver()')
+
+
+def make_tree(base, count, files_per_dir=20):
+    paths = []
+    for i in range(count):
+        path = os.path.join(base, 'site%04d' % i)
+        pkg = os.path.join(path, 'pkg%04d' % i)
+        os.makedirs(pkg)
+        for j in range(files_per_dir):
+            open(os.path.join(pkg, 'mod%02d.py' % j), 'w').close()
+        paths.append(path)
+    sdk = os.path.join(base, 'sdk', 'lib', 'python', 'NetApp')
+    os.makedirs(sdk)
+    with open(os.path.join(sdk, 'NaServer.py'), 'w') as module:
+        module.write('class NaServer(object):\n    pass\n')
+    return paths
+
+
+def run(code, env, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(counts):
+    print('%8s %12s %12s %16s' % (
+        'paths', 'python (s)', 'import (s)', 'warm load (s)'))
+    for count in counts:
+        base = tempfile.mkdtemp()
+        try:
+            paths = make_tree(base, count)
+            env = dict(os.environ)
+            env['PYTHONPATH'] = os.pathsep.join([ROOT] + paths)
+            env['NETAPP_METRICS_CACHE'] = os.path.join(base, 'cache')
+            env.pop('NETAPP_LIB_PATH', None)
+            # First load walks the filesystem and writes the cache.
+            subprocess.check_call(
+                [sys.executable, '-c', LOAD], env=env, cwd=base)
+            print('%8d %12.4f %12.4f %16.4f' % (
+                count, run(BASELINE, env), run(IMPORT, env), run(LOAD, env)))
+        finally:
+            shutil.rmtree(base)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000])
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Micro-benchmark of instance name normalization.
+
+Compares the per-instance cost of the inline sanitization that
+__collect_instances used to run on every poll with the memoized
+NameNormalizer, over several polls of the same instance names.
+
+    python benchmarks/bench_naming.py [instances] [polls]
+'''
+
+import os
+import re
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from netapp_metrics.naming import NameNormalizer  # noqa: E402
+
+
+def inline(name):
+    name = unicodedata.normalize('NFKD', name)
+    name = name.encode('ascii', 'ignore').decode('ascii')
+    name = name.replace('.', '_').strip('_')
+    name = name.replace('/', '.').strip('.')
+    return re.sub(r'[^a-zA-Z0-9._]', '_', name)
+
+
+def measure(function, names, polls):
+    start = time.time()
+    for _ in range(polls):
+        for name in names:
+            function(name)
+    return (time.time() - start) / (polls * len(names))
+
+
+def main(count, polls):
+    names = [u'/vol/vol%05d/lun.%d-é' % (i, i) for i in range(count)]
+    for scheme in ('graphite', 'prometheus'):
+        normalizer = NameNormalizer(scheme)
+        assert scheme != 'graphite' or \
+            [normalizer.instance(n) for n in names] == \
+            [inline(n) for n in names]
+    normalizer = NameNormalizer('graphite')
+    before = measure(inline, names, polls)
+    after = measure(normalizer.instance, names, polls)
+    print('%d instances x %d polls' % (count, polls))
+    print('inline:    %8.3f us/instance' % (before * 1e6))
+    print('memoized:  %8.3f us/instance' % (after * 1e6))
+    print('speedup:   %8.1fx' % (before / after))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [50000, 10][len(args):]))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Benchmark the public NetAppMetrics methods against ZapiSimulator.
+
+For every size and both C-mode and 7-mode this reports, per method,
+the wall time, the number of ZAPI calls, the request/response bytes
+and the peak Python memory (tracemalloc, measured in a second run).
+The NetApp OnTAP API library must be importable (see NETAPP_LIB_PATH).
+
+    python benchmarks/bench_suite.py [--naserver] [--latency MS]
+                                     [--counters N] [size ...]
+
+By default calls go through the pooled transport; --naserver uses
+NaServer for the perf calls instead.
+'''
+
+import gc
+import getopt
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from netapp_metrics.netapp_metrics import NetAppMetrics  # noqa: E402
+from netapp_metrics.simulator import ZapiSimulator  # noqa: E402
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+COUNTERS = ['total_ops', 'avg_latency', 'busy', 'base_time']
+
+
+def methods(netapp, kind):
+    instances = netapp.get_instances(kind)
+    return [
+        ('get_objects', lambda: netapp.get_objects()),
+        ('get_info', lambda: netapp.get_info(kind)),
+        ('get_instances', lambda: netapp.get_instances(kind)),
+        ('get_metrics', lambda: netapp.get_metrics(kind, instances, COUNTERS)),
+        ('get_metrics(all)', lambda: netapp.get_metrics(kind, instances)),
+        ('iter_metrics', lambda: sum(
+            1 for _ in netapp.iter_metrics(kind, instances, COUNTERS))),
+        ('get_frame', lambda: netapp.get_frame(kind, instances, COUNTERS)),
+        ('get_vol_space_info', lambda: netapp.get_vol_space_info()),
+        ('get_vol_space_info(filter)', lambda: netapp.get_vol_space_info(
+            ['name', 'size-used'])),
+        ('get_lun_info', lambda: netapp.get_lun_info()),
+        ('get_aggr_info', lambda: netapp.get_aggr_info()),
+    ]
+
+
+def measure(simulator, function):
+    gc.collect()
+    simulator.reset_stats()
+    start = time.time()
+    function()
+    elapsed = time.time() - start
+    calls = simulator.total_calls
+    sent, received = simulator.bytes_in, simulator.bytes_out
+    peak = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, calls, sent, received, peak
+
+
+def run(size, clustered, pooled, latency, counters):
+    simulator = ZapiSimulator(
+        clustered=clustered, instances=size, volumes=size,
+        counters=counters, latency=latency / 1000.0)
+    with simulator:
+        netapp = NetAppMetrics(
+            simulator.host, 'user', 'password', port=simulator.port,
+            schema_cache=False, pool_size=1 if pooled else None)
+        print('\n%s, %d instances/volumes, %d counters' % (
+            'C-mode' if clustered else '7-mode', size, counters))
+        print('%-28s %10s %7s %12s %12s %12s' % (
+            'method', 'wall (s)', 'calls', 'sent (B)', 'recv (B)',
+            'peak (KiB)'))
+        for name, function in methods(netapp, 'volume'):
+            elapsed, calls, sent, received, peak = measure(
+                simulator, function)
+            print('%-28s %10.3f %7d %12d %12d %12s' % (
+                name, elapsed, calls, sent, received,
+                '-' if peak is None else peak // 1024))
+        netapp.close()
+
+
+def main(argv):
+    opts, args = getopt.getopt(argv, '', ['naserver', 'latency=',
+                                          'counters='])
+    opts = dict(opts)
+    sizes = [int(arg) for arg in args] or [1000, 10000, 100000]
+    for size in sizes:
+        for clustered in (True, False):
+            run(size, clustered, '--naserver' not in opts,
+                float(opts.get('--latency', 0)),
+                int(opts.get('--counters', 20)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
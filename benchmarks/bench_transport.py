@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Calls per second of the ZAPI transport against a local stand-in
+ZAPI HTTP server, with a new connection per call (what NaServer does)
+and with pooled keep-alive connections.
+
+    python benchmarks/bench_transport.py [calls] [threads] [latency_ms]
+
+latency_ms adds a delay to every TCP connect to stand in for the
+handshake cost of a remote filer.
+'''
+
+import os
+import sys
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from netapp_metrics.transport import ZapiTransport  # noqa: E402
+
+RESPONSE = (
+    b"<?xml version='1.0' encoding='UTF-8' ?>"
+    b"<netapp version='1.15' xmlns='http://www.netapp.com/filer/admin'>"
+    b"<results status='passed'><is-clustered>true</is-clustered>"
+    b"<version>NetApp Release 8.3.1</version></results></netapp>"
+)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    connect_delay = 0
+
+    def get_request(self):
+        request = HTTPServer.get_request(self)
+        time.sleep(self.connect_delay)
+        return request
+
+
+def run(transport, calls, threads):
+    pool = ThreadPool(threads)
+    start = time.time()
+    pool.map(lambda _: transport.request('<system-get-version/>'),
+             range(calls))
+    elapsed = time.time() - start
+    pool.close()
+    return calls / elapsed
+
+
+def main(calls, threads, latency_ms):
+    server = Server(('127.0.0.1', 0), Handler)
+    server.connect_delay = latency_ms / 1000.0
+    worker = threading.Thread(target=server.serve_forever)
+    worker.daemon = True
+    worker.start()
+    port = server.server_address[1]
+    print('%d calls, %d threads, %dms connect latency' % (
+        calls, threads, latency_ms))
+    for label, keep_alive in (('new connection', False),
+                              ('pooled keep-alive', True)):
+        transport = ZapiTransport('127.0.0.1', 'user', 'password', port=port,
+                                  pool_size=threads, keep_alive=keep_alive)
+        rate = run(transport, calls, threads)
+        print('%-18s %8.0f calls/s %6d connections' % (
+            label, rate, transport.connections_made))
+        transport.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [2000, 4, 5][len(args):]))
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import re
+
+from array import array
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+NAN = float('nan')
+INF = float('inf')
+
+# Bucket labels of latency histograms, e.g. <20us, <1ms, >20s
+_BOUND = re.compile(r'^\s*([<>])\s*([0-9.]+)\s*(ns|us|ms|s)\s*$')
+_UNITS = {'ns': 0.001, 'us': 1.0, 'ms': 1000.0, 's': 1000000.0}
+
+
+def parse_array(value, size=None):
+    '''Return the values of an array counter string ("1,2,3") as an
+       array of doubles, NaN where a value is not a number.  Arrays
+       shorter than size are padded with NaN.'''
+    values = array('d')
+    if value:
+        for item in value.split(','):
+            try:
+                values.append(float(item))
+            except ValueError:
+                values.append(NAN)
+    if size is not None and len(values) < size:
+        values.extend(array('d', [NAN]) * (size - len(values)))
+    return values
+
+
+def label_bounds(labels):
+    '''Return (lower, upper) microsecond bounds for histogram bucket
+       labels, or None when the labels are not histogram buckets (e.g.
+       per protocol breakdowns).'''
+    bounds = []
+    lower = 0.0
+    for label in labels:
+        match = _BOUND.match(label)
+        if match is None:
+            return None
+        value = float(match.group(2)) * _UNITS[match.group(3)]
+        if match.group(1) == '<':
+            bounds.append((lower, value))
+            lower = value
+        else:
+            bounds.append((value, INF))
+    return bounds
+
+
+def _percentile(values, start, stop, bounds, percent):
+    total = 0.0
+    for i in range(start, stop):
+        if values[i] == values[i]:
+            total += values[i]
+    if total <= 0:
+        return None
+    rank = total * percent / 100.0
+    seen = 0.0
+    for bucket, i in enumerate(range(start, stop)):
+        count = values[i]
+        if count != count or count <= 0:
+            continue
+        if seen + count >= rank:
+            low, high = bounds[bucket]
+            if high == INF:
+                return low
+            return low + (high - low) * (rank - seen) / count
+        seen += count
+    return bounds[-1][0]
+
+
+class LabeledArray(Mapping):
+    '''Read only {label: value} view of an array counter value.'''
+
+    __slots__ = ('labels', 'values', '_bounds')
+
+    def __init__(self, labels, values, bounds=None):
+        self.labels = tuple(labels)
+        self.values = values
+        self._bounds = bounds
+
+    @classmethod
+    def parse(cls, labels, value, bounds=None):
+        return cls(labels, parse_array(value, len(labels)), bounds)
+
+    def __getitem__(self, label):
+        return self.values[self.labels.index(label)]
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def total(self):
+        return sum(v for v in self.values if v == v)
+
+    def percentile(self, percent):
+        '''Interpolated percentile of a histogram in microseconds, None
+           when empty or when the labels are not bucket bounds.'''
+        if self._bounds is None:
+            self._bounds = label_bounds(self.labels)
+        if not self._bounds:
+            return None
+        return _percentile(self.values, 0, len(self.labels), self._bounds,
+                           percent)
+
+    def __repr__(self):
+        return 'LabeledArray(%r)' % dict(self)
+
+
+class ArrayColumn:
+    '''One array counter for many instances, parsed once into a row
+       major array of doubles with one row per instance and one column
+       per label, for bulk totals and percentiles.'''
+
+    def __init__(self, counter, labels, instances, values, timestamp=None):
+        self.counter = counter
+        self.labels = tuple(labels)
+        self.instances = tuple(instances)
+        self.values = values
+        self.timestamp = timestamp
+        self.bounds = label_bounds(self.labels)
+        self._rows = dict((name, i) for i, name in enumerate(self.instances))
+
+    @classmethod
+    def from_strings(cls, counter, labels, records, timestamp=None):
+        '''Build a column from (instance, array counter string)
+           records.'''
+        width = len(labels)
+        instances = []
+        values = array('d')
+        for name, value in records:
+            instances.append(name)
+            row = parse_array(value, width)
+            values.extend(row[:width])
+        return cls(counter, labels, instances, values, timestamp)
+
+    def __len__(self):
+        return len(self.instances)
+
+    def row(self, instance):
+        width = len(self.labels)
+        start = self._rows[instance] * width
+        return LabeledArray(self.labels, self.values[start:start + width],
+                            self.bounds)
+
+    def totals(self):
+        '''Return the sum of the buckets of every instance.'''
+        width = len(self.labels)
+        totals = array('d', [0.0]) * len(self.instances)
+        for row in range(len(self.instances)):
+            total = 0.0
+            for value in self.values[row * width:(row + 1) * width]:
+                if value == value:
+                    total += value
+            totals[row] = total
+        return totals
+
+    def percentiles(self, percent):
+        '''Return the percentile of every instance, NaN for instances
+           with an empty histogram.'''
+        if not self.bounds:
+            raise ValueError('%s is not a histogram' % self.counter)
+        width = len(self.labels)
+        result = array('d', [NAN]) * len(self.instances)
+        for row in range(len(self.instances)):
+            value = _percentile(self.values, row * width, (row + 1) * width,
+                                self.bounds, percent)
+            if value is not None:
+                result[row] = value
+        return result
+
+    def sum(self):
+        '''Return the buckets summed over every instance.'''
+        width = len(self.labels)
+        sums = array('d', [0.0]) * width
+        for i, value in enumerate(self.values):
+            if value == value:
+                sums[i % width] += value
+        return LabeledArray(self.labels, sums, self.bounds)
+
+    def delta(self, previous):
+        '''Return a column of the bucket increments since previous, for
+           the instances present in both.  Buckets that went backwards
+           are NaN.'''
+        width = len(self.labels)
+        instances = []
+        values = array('d')
+        for row, name in enumerate(self.instances):
+            before = previous._rows.get(name)
+            if before is None:
+                continue
+            instances.append(name)
+            for col in range(width):
+                current = self.values[row * width + col]
+                old = previous.values[before * width + col]
+                values.append(current - old if current >= old else NAN)
+        return ArrayColumn(self.counter, self.labels, instances, values,
+                           self.timestamp)
+
+
+# EOF
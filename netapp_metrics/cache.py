@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import time
+
+from collections import OrderedDict
+from collections import namedtuple as NamedTuple
+
+
+class SchemaCache:
+    '''In memory and on disk cache for perf object schemas.
+
+       Entries are keyed on the device, its ONTAP version tuple and the
+       API/object the schema was fetched for.  Each device is stored in
+       its own gzipped JSON file; a file written for a different version
+       tuple is discarded on load, so an upgraded filer is re-read.  The
+       in memory copy is bounded (LRU) and every entry expires after
+       ttl seconds.
+
+       New entries are written at once unless the device file was
+       written less than flush_interval seconds ago; those are written
+       by the next get() or set() after the interval, so a collector
+       killed without running atexit loses at most flush_interval
+       seconds of schemas.'''
+
+    def __init__(self, path=None, ttl=86400, max_entries=4096,
+                 flush_interval=5):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()
+        self._loaded = {}
+        self._dirty = {}
+        self._flushed = {}
+        import threading
+        self._lock = threading.RLock()
+        if path is not None:
+            import atexit
+            atexit.register(self.flush)
+
+    def _filename(self, device):
+        import hashlib
+        digest = hashlib.sha1(device.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, '%s.json.gz' % digest)
+
+    def _expired(self, stamp, now):
+        return self.ttl is not None and now - stamp > self.ttl
+
+    def _read(self, device, version):
+        '''Return the on disk entries of device for version.'''
+        import gzip
+        import json
+        filename = self._filename(device)
+        try:
+            with gzip.open(filename, 'rb') as cache:
+                data = json.loads(cache.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return []
+        if tuple(data.get('version', ())) != version:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            return []
+        now = time.time()
+        return [
+            (api, kind, stamp, value)
+            for api, kind, stamp, value in data.get('entries', [])
+            if not self._expired(stamp, now)
+        ]
+
+    def _load(self, device, version):
+        if self.path is None or self._loaded.get(device) == version:
+            return
+        self._loaded[device] = version
+        for api, kind, stamp, value in self._read(device, version):
+            value = dict((k, tuple(v)) for k, v in value.items())
+            self._store((device, version, api, kind), stamp, value)
+
+    def _store(self, key, stamp, value):
+        self._entries.pop(key, None)
+        self._entries[key] = (stamp, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _flush_due(self, now):
+        for device, since in list(self._dirty.items()):
+            if now - max(since, self._flushed.get(device, 0)) >= \
+                    self.flush_interval:
+                self._flush_device(device)
+
+    def get(self, device, version, api, kind=''):
+        '''Return a cached schema or None when missing or expired.'''
+        version = tuple(version)
+        key = (device, version, api, kind)
+        with self._lock:
+            self._load(device, version)
+            if self._dirty:
+                self._flush_due(time.time())
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if self._expired(entry[0], time.time()):
+                return None
+            self._entries[key] = entry
+            return entry[1]
+
+    def set(self, device, version, api, kind, value):
+        version = tuple(version)
+        now = time.time()
+        with self._lock:
+            self._load(device, version)
+            for key in [k for k in self._entries
+                        if k[0] == device and k[1] != version]:
+                del self._entries[key]
+            self._store((device, version, api, kind), now, value)
+            if self.path is not None:
+                self._dirty.setdefault(device, now)
+                if now - self._flushed.get(device, 0) >= \
+                        self.flush_interval:
+                    self._flush_device(device)
+                else:
+                    self._flush_due(now)
+
+    def invalidate(self, device):
+        '''Forget everything cached for device, on disk too.'''
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == device]:
+                del self._entries[key]
+            self._loaded.pop(device, None)
+            self._dirty.pop(device, None)
+            if self.path is not None:
+                try:
+                    os.remove(self._filename(device))
+                except OSError:
+                    pass
+
+    def _flush_device(self, device):
+        self._dirty.pop(device, None)
+        self._flushed[device] = time.time()
+        version = self._loaded.get(device)
+        if version is None:
+            return
+        # Entries evicted from memory are kept from the previous file.
+        merged = OrderedDict(
+            ((api, kind), [api, kind, stamp, value])
+            for api, kind, stamp, value in self._read(device, version))
+        for (dev, ver, api, kind), (stamp, value) in self._entries.items():
+            if dev == device and ver == version:
+                merged[(api, kind)] = [api, kind, stamp, value]
+        data = {'version': list(version), 'entries': list(merged.values())}
+        import gzip
+        import json
+        try:
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            filename = self._filename(device)
+            tmpname = '%s.%d.tmp' % (filename, os.getpid())
+            with gzip.open(tmpname, 'wb') as cache:
+                cache.write(json.dumps(
+                    data, separators=(',', ':')).encode('utf-8'))
+            os.rename(tmpname, filename)
+        except (IOError, OSError):
+            pass
+
+    def flush(self):
+        '''Write every device with pending changes to disk.'''
+        with self._lock:
+            for device in list(self._dirty):
+                self._flush_device(device)
+
+
+InstanceSet = NamedTuple(
+    'InstanceSet', ['instances', 'added', 'removed', 'stamp', 'names'])
+
+
+class InstanceCache:
+    '''Instance index per (device, object kind, filter).
+
+       The first lookup of a key enumerates its instances synchronously.
+       Once an entry is older than refresh_interval it is re-enumerated,
+       in a background thread when background is set, while callers keep
+       getting the last known list.  Every refresh records which
+       instances were added and removed since the previous one.  When
+       fetch() returns a {instance: name} dict (C-mode uuids and their
+       names) the names are kept in names.'''
+
+    def __init__(self, refresh_interval=300, background=True):
+        self.refresh_interval = refresh_interval
+        self.background = background
+        self.errors = {}
+        self._entries = {}
+        self._refreshing = set()
+        import threading
+        self._lock = threading.Lock()
+
+    def _refresh(self, key, fetch):
+        try:
+            fetched = fetch()
+            names = dict(fetched) if isinstance(fetched, dict) else {}
+            instances = frozenset(fetched)
+        except Exception as e:
+            with self._lock:
+                self.errors[key] = e
+                self._refreshing.discard(key)
+            raise
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is None:
+                entry = InstanceSet(
+                    instances, instances, frozenset(), time.time(), names)
+            else:
+                entry = InstanceSet(
+                    instances,
+                    instances - previous.instances,
+                    previous.instances - instances,
+                    time.time(), names)
+            self._entries[key] = entry
+            self.errors.pop(key, None)
+            self._refreshing.discard(key)
+        return entry
+
+    def _background_refresh(self, key, fetch):
+        try:
+            self._refresh(key, fetch)
+        except Exception:
+            # Kept in self.errors, the stale entry stays in use.
+            pass
+
+    def get(self, device, kind, filter, fetch, refresh=False):
+        '''Return the InstanceSet of key, fetch() enumerates instances.'''
+        key = (device, kind, filter)
+        with self._lock:
+            entry = self._entries.get(key)
+            stale = entry is None or refresh or (
+                time.time() - entry.stamp >= self.refresh_interval)
+            if not stale:
+                return entry
+            if entry is not None and self.background and not refresh:
+                if key not in self._refreshing:
+                    import threading
+                    self._refreshing.add(key)
+                    worker = threading.Thread(
+                        target=self._background_refresh, args=(key, fetch))
+                    worker.daemon = True
+                    worker.start()
+                return entry
+            self._refreshing.add(key)
+        return self._refresh(key, fetch)
+
+    def invalidate(self, device=None, kind=None):
+        with self._lock:
+            for key in list(self._entries):
+                if device in (None, key[0]) and kind in (None, key[1]):
+                    del self._entries[key]
+
+
+# EOF
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import sys
+
+from array import array
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+try:
+    intern = sys.intern
+except AttributeError:
+    pass
+
+NAN = float('nan')
+
+
+class _FrameRow(Mapping):
+    '''Read only {counter: value} view of one instance of a frame.'''
+
+    __slots__ = ('_frame', '_row')
+
+    def __init__(self, frame, row):
+        self._frame = frame
+        self._row = row
+
+    def __getitem__(self, counter):
+        value = self._frame._get(self._row, self._frame._columns[counter])
+        if value is None:
+            raise KeyError(counter)
+        return value
+
+    def __iter__(self):
+        frame = self._frame
+        for col, counter in enumerate(frame.counters):
+            if frame._get(self._row, col) is not None:
+                yield counter
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class MetricFrame(Mapping):
+    '''Columnar get_metrics result.
+
+       Instance and counter names are interned once and every value is
+       parsed once into a row major array of doubles, one row per
+       instance and one column per counter, with a single poll
+       timestamp.  Values that are not numbers (strings, array
+       counters) are kept as strings on the side; counters an instance
+       did not report are NaN and absent from its row.
+
+       The frame is a read only {instance: {counter: value}} mapping so
+       code written against get_metrics keeps working, except that
+       numeric values come back as floats instead of strings.'''
+
+    def __init__(self, instances, counters, values, timestamp, strings=None):
+        self.instances = tuple(instances)
+        self.counters = tuple(counters)
+        self.values = values
+        self.timestamp = timestamp
+        self.strings = strings or {}
+        self._rows = dict((name, i) for i, name in enumerate(self.instances))
+        self._columns = dict((name, i) for i, name in enumerate(self.counters))
+
+    @classmethod
+    def from_records(cls, records, timestamp=None):
+        '''Build a frame from (instance, {counter: value}) records such
+           as the ones yielded by NetAppMetrics.iter_metrics.  Records of
+           an instance seen before are merged into its row.'''
+        instances = []
+        rows = {}
+        columns = {}
+        counters = []
+        strings = {}
+        values = array('d')
+        for record in records:
+            name, instance_data = record[0], record[1]
+            if len(record) > 2 and record[2] is not None:
+                timestamp = record[2]
+            for counter in instance_data:
+                if counter not in columns:
+                    # New counters are rare after the first instance, so
+                    # widening the whole array is cheap enough.
+                    width = len(counters)
+                    columns[counter] = width
+                    counters.append(intern(str(counter)))
+                    widened = array('d', [NAN]) * (len(instances) * (width + 1))
+                    for row in range(len(instances)):
+                        start = row * (width + 1)
+                        widened[start:start + width] = \
+                            values[row * width:(row + 1) * width]
+                    values = widened
+            width = len(counters)
+            row = rows.get(name)
+            if row is None:
+                row = rows[name] = len(instances)
+                instances.append(intern(str(name)))
+                values.extend(array('d', [NAN]) * width)
+            base = row * width
+            for counter, value in instance_data.items():
+                col = columns[counter]
+                try:
+                    values[base + col] = float(value)
+                except (TypeError, ValueError):
+                    strings[(row, col)] = value
+        return cls(instances, counters, values, timestamp, strings)
+
+    def _get(self, row, col):
+        value = self.values[row * len(self.counters) + col]
+        if value != value:
+            return self.strings.get((row, col))
+        return value
+
+    def __getitem__(self, instance):
+        return _FrameRow(self, self._rows[instance])
+
+    def __iter__(self):
+        return iter(self.instances)
+
+    def __len__(self):
+        return len(self.instances)
+
+    def value(self, instance, counter, default=None):
+        value = self._get(self._rows[instance], self._columns[counter])
+        return default if value is None else value
+
+    def column(self, counter):
+        '''Return the numeric values of counter for every instance, in
+           instance order, NaN where missing or not numeric.'''
+        if counter not in self._columns:
+            return array('d', [NAN]) * len(self.instances)
+        width = len(self.counters)
+        return self.values[self._columns[counter]::width]
+
+    def row(self, instance):
+        '''Return the numeric values of instance in counter order.'''
+        width = len(self.counters)
+        start = self._rows[instance] * width
+        return self.values[start:start + width]
+
+    def as_dict(self):
+        return dict((name, dict(self[name])) for name in self.instances)
+
+    @property
+    def nbytes(self):
+        return self.values.itemsize * len(self.values)
+
+
+# EOF
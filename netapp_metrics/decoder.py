@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+from netapp_metrics.naming import get_normalizer
+
+
+def _etree():
+    '''ElementTree, imported on first use so importing the package
+       stays cheap.'''
+    try:
+        from xml.etree import cElementTree as etree
+    except ImportError:
+        from xml.etree import ElementTree as etree
+    return etree
+
+
+def _name(elem):
+    tag = elem.tag
+    if tag[0] == '{':
+        return tag[tag.index('}') + 1:]
+    return tag
+
+
+def as_filter(filter):
+    if filter is not None and (
+            hasattr(filter, "__getitem__") or hasattr(filter, "__iter__")):
+        if hasattr(filter, "strip"):
+            return frozenset([filter])
+        return frozenset(filter)
+    elif filter is None:
+        return None
+    raise TypeError('filter (%s) is of an unknown type!' % filter)
+
+
+def decode_element(head, filter=None):
+    '''ElementTree port of NetAppMetrics._decode_elements2dict.
+
+       filter must already be a set (or None), see as_filter.'''
+    children = list(head)
+    if not children:
+        return {
+            'name': _name(head),
+            'content': head.text or '',
+            'children': [],
+            'attrkeys': list(head.attrib),
+            'attrvals': list(head.attrib.values()),
+        }
+    leaves = [len(item) == 0 for item in children]
+    if all(leaves):
+        return {
+            _name(head): dict(
+                (_name(item), item.text or '')
+                for item in children
+                if filter is None or _name(item) in filter
+            )
+        }
+    elif not any(leaves):
+        return [decode_element(item, filter) for item in children]
+    ans = {}
+    for item in children:
+        if len(item):
+            ans[_name(item)] = decode_element(item, filter)
+        else:
+            ans[_name(item)] = item.text or ''
+    return ans
+
+
+def leaf_paths(head, prefix=()):
+    '''Yield the tag path of every leaf below and including head.'''
+    prefix = prefix + (_name(head),)
+    if not len(head):
+        yield prefix
+    for item in head:
+        for path in leaf_paths(item, prefix):
+            yield path
+
+
+class RecordStream:
+    '''Incrementally decode the records of a ZAPI list response.
+
+       Iterating yields decode_element(record, filter) for every child
+       of the results' container element (attributes-list, luns, ...)
+       as soon as the record has been parsed, after which the record is
+       dropped, so only one record is held in memory.  The other
+       leaves of results (num-records, next-tag, ...) are collected in
+       info.  A failed call raises ValueError(error % reason).  When
+       paths is a set, the leaf_paths of every record are added to it.'''
+
+    def __init__(self, source, container, filter=None, error='%s',
+                 paths=None):
+        self.source = source
+        self.container = container
+        self.filter = as_filter(filter)
+        self.error = error
+        self.paths = paths
+        self.info = {}
+
+    def __iter__(self):
+        depth = 0
+        parent = None
+        for event, elem in _etree().iterparse(
+                self.source, ('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 2 and _name(elem) == 'results':
+                    if elem.get('status', 'passed') != 'passed':
+                        raise ValueError(self.error % elem.get('reason'))
+                elif depth == 3 and _name(elem) == self.container:
+                    parent = elem
+                continue
+            depth -= 1
+            if depth == 3 and parent is not None:
+                if self.paths is not None:
+                    self.paths.update(leaf_paths(elem))
+                yield decode_element(elem, self.filter)
+                parent.remove(elem)
+            elif depth == 2:
+                if elem is parent:
+                    parent = None
+                elif not len(elem):
+                    self.info[_name(elem)] = elem.text or ''
+                elem.clear()
+
+
+class DecodedResults:
+    '''Compact perf-object-get-instances(-iter-next) results.
+
+       Answers the few NaElement calls the perf code makes on results
+       (results_errno, results_reason, child_get_string); instances is
+       a list of (name, {counter: value}) with names already
+       normalized.'''
+
+    def __init__(self, status, reason, errno, fields, instances):
+        self.status = status
+        self.reason = reason
+        self.errno = errno
+        self.fields = fields
+        self.instances = instances
+
+    def results_errno(self):
+        return self.errno if self.status != 'passed' else 0
+
+    def results_reason(self):
+        return self.reason
+
+    def child_get_string(self, name):
+        return self.fields.get(name)
+
+    def child_get(self, name):
+        return None
+
+
+def decode_perf_response(body, naming='graphite'):
+    '''Decode a raw perf instances response body into DecodedResults,
+       naming counters and instances with the given scheme.  Runs in
+       DecodePool workers, so it only takes and returns plain data.'''
+    names = get_normalizer(naming)
+    for results in _etree().fromstring(body):
+        if _name(results) == 'results':
+            break
+    else:
+        raise ValueError('no results in ZAPI response')
+    fields = {}
+    instances = []
+    for child in results:
+        tag = _name(child)
+        if tag != 'instances':
+            fields[tag] = child.text or ''
+            continue
+        for instance in child:
+            name = None
+            data = {}
+            for item in instance:
+                field = _name(item)
+                if field == 'counters':
+                    for counter in item:
+                        counter_name = value = None
+                        for leaf in counter:
+                            if _name(leaf) == 'name':
+                                counter_name = leaf.text
+                            elif _name(leaf) == 'value':
+                                value = leaf.text
+                        data[names.counter(counter_name)] = value
+                elif field == 'uuid' and item.text:
+                    name = item.text
+                elif field == 'name' and name is None:
+                    name = item.text
+            instances.append((names.instance(name), data))
+    return DecodedResults(
+        results.get('status', 'passed'), results.get('reason'),
+        int(results.get('errno') or 0), fields, instances)
+
+
+def _pool_context():
+    '''Start method for decode workers: forking a process that has
+       polling threads running can copy locks held by those threads,
+       so forkserver (or spawn) is used where available.'''
+    import multiprocessing
+    if not hasattr(multiprocessing, 'get_context'):
+        return multiprocessing
+    for method in ('forkserver', 'spawn'):
+        if method in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context(method)
+    return multiprocessing
+
+
+class DecodePool:
+    '''Decode perf responses in a pool of worker processes.
+
+       Threads keep doing the network I/O and hand the raw body to
+       decode(), which blocks the calling thread (not the GIL) until a
+       worker returns the decoded results.  The workers are started
+       here, from the forkserver or spawn start method where available,
+       so create the pool from the main thread of a program guarded by
+       if __name__ == '__main__'.  Workers only know the built-in
+       naming schemes unless initializer registers others.  With
+       processes=0 responses are decoded on the calling thread.'''
+
+    def __init__(self, processes=None, initializer=None):
+        self.processes = processes
+        self._pool = None
+        if processes != 0:
+            self._pool = _pool_context().Pool(processes, initializer)
+
+    def decode(self, body, naming='graphite'):
+        if self._pool is None:
+            if self.processes != 0:
+                raise ValueError('decode pool is closed')
+            return decode_perf_response(body, naming)
+        return self._pool.apply(decode_perf_response, (body, naming))
+
+    def close(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+# EOF
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import threading
+import time
+
+from collections import namedtuple as NamedTuple
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+from netapp_metrics.netapp_metrics import NetAppMetrics
+
+FleetResult = NamedTuple(
+    'FleetResult', ['device', 'value', 'error', 'elapsed'])
+
+
+class DeviceBusy(TimeoutError):
+    '''The device is still running calls from an earlier sweep.'''
+
+
+class FleetCollector:
+    '''Collect from many NetApp devices at once.
+
+       Work for every device runs on a shared pool of workers threads.
+       At most per_device calls run against one device at the same time
+       so a filer's management CPU is not swamped, and timeout is used
+       as the connection timeout of every device.  Results are yielded
+       as FleetResult tuples in completion order.  A device whose
+       earlier calls are still running (e.g. past a map() timeout) is
+       not queued on; it is reported at once with a DeviceBusy error,
+       so a slow filer cannot tie up the shared workers.'''
+
+    def __init__(self, workers=16, per_device=1, timeout=None):
+        self.workers = workers
+        self.per_device = per_device
+        self.timeout = timeout
+        self._devices = {}
+        self._connections = {}
+        self._limits = {}
+        self._locks = {}
+        self._pool = None
+
+    def add(self, device, user, password, **kwargs):
+        '''Register a device; kwargs are passed to NetAppMetrics.  The
+           connection is made by a worker on first use.'''
+        kwargs.setdefault('timeout', self.timeout)
+        self._devices[device] = (user, password, kwargs)
+        self._limits[device] = threading.BoundedSemaphore(self.per_device)
+        self._locks[device] = threading.Lock()
+        self._connections.pop(device, None)
+
+    def remove(self, device):
+        for registry in (self._devices, self._connections, self._limits,
+                         self._locks):
+            registry.pop(device, None)
+
+    @property
+    def devices(self):
+        return sorted(self._devices)
+
+    def connection(self, device):
+        '''Return the NetAppMetrics of device, connecting if needed.'''
+        with self._locks[device]:
+            if device not in self._connections:
+                user, password, kwargs = self._devices[device]
+                self._connections[device] = NetAppMetrics(
+                    device, user, password, **kwargs)
+            return self._connections[device]
+
+    def _run(self, device, func, results, limit):
+        # limit is the semaphore acquired by map(); the device may have
+        # been removed or added again since.
+        start = time.time()
+        value = None
+        error = None
+        try:
+            value = func(self.connection(device))
+        except Exception as e:
+            error = e
+        finally:
+            try:
+                limit.release()
+            finally:
+                results.put(FleetResult(
+                    device, value, error, time.time() - start))
+
+    def map(self, func, devices=None, timeout=None):
+        '''Call func(NetAppMetrics) for every device and yield a
+           FleetResult per device as soon as it completes.  Devices
+           still running after timeout seconds are yielded with a
+           TimeoutError.'''
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers)
+        if devices is None:
+            devices = self.devices
+        results = Queue()
+        start = time.time()
+        pending = set()
+        for device in devices:
+            if device in pending:
+                continue
+            limit = self._limits[device]
+            if not limit.acquire(False):
+                error = DeviceBusy(
+                    '%s is still busy with an earlier call' % device)
+                yield FleetResult(device, None, error, 0.0)
+                continue
+            pending.add(device)
+            self._pool.apply_async(
+                self._run, (device, func, results, limit))
+        while pending:
+            try:
+                if timeout is None:
+                    # A finite wait keeps the loop interruptible.
+                    result = results.get(timeout=3600)
+                else:
+                    result = results.get(
+                        timeout=max(0, start + timeout - time.time()))
+            except Empty:
+                if timeout is None:
+                    continue
+                elapsed = time.time() - start
+                for device in sorted(pending):
+                    error = TimeoutError(
+                        '%s did not answer within %ss' % (device, timeout))
+                    yield FleetResult(device, None, error, elapsed)
+                return
+            pending.discard(result.device)
+            yield result
+
+    def get_objects(self, devices=None, timeout=None):
+        return self.map(lambda netapp: netapp.get_objects(), devices, timeout)
+
+    def get_info(self, kind, devices=None, timeout=None):
+        return self.map(lambda netapp: netapp.get_info(kind), devices, timeout)
+
+    def get_instances(self, kind, filter='', devices=None, timeout=None):
+        return self.map(
+            lambda netapp: netapp.get_instances(kind, filter),
+            devices, timeout)
+
+    def get_metrics(self, kind, metrics=[], filter='', devices=None,
+                    timeout=None):
+        '''get_metrics for every instance of kind on every device, the
+           instance lists come from each device's instance cache.'''
+        def collect(netapp):
+            instances = netapp.get_cached_instances(kind, filter).instances
+            return netapp.get_metrics(kind, instances, metrics)
+        return self.map(collect, devices, timeout)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+
+# EOF
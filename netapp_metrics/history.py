@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+
+_MAGIC = b'NMHIST02'
+_HEADER = struct.Struct('<8sII')
+_HEADER_SIZE = 64
+# fingerprint of the key, number of samples written, padding
+_SLOT = struct.Struct('<QII')
+_FINGERPRINT = struct.Struct('<Q')
+_COUNT = struct.Struct('<I')
+# filer timestamp, raw value
+_SAMPLE = struct.Struct('<dd')
+_TIMESTAMP = struct.Struct('<d')
+_LOAD_FACTOR = 0.7
+
+
+def table_slots(keys):
+    '''Smallest power of two number of slots holding keys entries below
+       the load factor.'''
+    slots = 1024
+    while slots * _LOAD_FACTOR < keys:
+        slots *= 2
+    return slots
+
+
+class SampleHistory:
+    '''Last depth raw samples of every (device, object, instance,
+       counter), in a memory mapped file.
+
+       The file is a hash table of fixed-size slots, sized for keys
+       entries, found by open addressing on a 64 bit fingerprint of the
+       key.  Each slot holds a ring of depth (timestamp, value)
+       samples, so recording a poll writes in place and opening the
+       file again only maps it; nothing is read until a key is looked
+       up.  A key is looked for in at most probes consecutive slots;
+       when they are all taken by other keys the one written least
+       recently is given to the new key, so instances that went away
+       age out and a full table costs no more than probes reads per
+       new key.  A file made for a different number of slots or depth
+       is started afresh.  Only one process should write a file at a
+       time.'''
+
+    def __init__(self, path, keys=100000, depth=4, probes=16):
+        self.path = path
+        self.slots = table_slots(keys)
+        self.depth = depth
+        self.probes = min(probes, self.slots)
+        self.slot_size = _SLOT.size + depth * _SAMPLE.size
+        self.size = _HEADER_SIZE + self.slots * self.slot_size
+        self.evictions = 0
+        self._mask = self.slots - 1
+        # (device, kind, instance, counter) -> slot offset and back, for
+        # the keys looked up by this process
+        self._offsets = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._open()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        mode = 'r+b' if os.path.exists(self.path) else 'w+b'
+        self._file = open(self.path, mode)
+        header = self._file.read(_HEADER.size)
+        expected = _HEADER.pack(_MAGIC, self.slots, self.depth)
+        if header != expected or \
+                os.fstat(self._file.fileno()).st_size != self.size:
+            self._file.seek(0)
+            self._file.truncate(0)
+            self._file.truncate(self.size)
+            self._file.write(expected)
+            self._file.flush()
+        self._map = mmap.mmap(self._file.fileno(), self.size)
+
+    def _prefix(self, device, kind, instance):
+        return hashlib.sha1(
+            ('%s\0%s\0%s\0' % (device, kind, instance)).encode('utf-8'))
+
+    def _fingerprint(self, prefix, counter):
+        digest = prefix.copy()
+        digest.update(counter.encode('utf-8'))
+        return _FINGERPRINT.unpack(digest.digest()[:8])[0] or 1
+
+    def _newest(self, offset, written):
+        if not written:
+            return float('-inf')
+        return _TIMESTAMP.unpack_from(self._map, offset + _SLOT.size + (
+            (written - 1) % self.depth) * _SAMPLE.size)[0]
+
+    def _find(self, fingerprint, create=False):
+        '''Return the offset of the slot of fingerprint, or None.'''
+        start = fingerprint & self._mask
+        victim = None
+        victim_stamp = None
+        for probe in range(self.probes):
+            offset = _HEADER_SIZE + (
+                (start + probe) & self._mask) * self.slot_size
+            stored, written, _ = _SLOT.unpack_from(self._map, offset)
+            if stored == fingerprint:
+                return offset
+            if not stored:
+                if not create:
+                    return None
+                _SLOT.pack_into(self._map, offset, fingerprint, 0, 0)
+                return offset
+            if create:
+                stamp = self._newest(offset, written)
+                if victim is None or stamp < victim_stamp:
+                    victim = offset
+                    victim_stamp = stamp
+        if not create:
+            return None
+        self.evictions += 1
+        _SLOT.pack_into(self._map, victim, fingerprint, 0, 0)
+        return victim
+
+    def _offset(self, key, prefix=None, create=False):
+        '''Return the slot offset of key, or None.'''
+        offset = self._offsets.get(key)
+        if offset is not None:
+            return offset
+        if prefix is None:
+            prefix = self._prefix(*key[:3])
+        offset = self._find(self._fingerprint(prefix, key[3]), create)
+        if offset is not None:
+            # Forget the key evicted from the slot, if any.
+            self._offsets.pop(self._keys.get(offset), None)
+            self._offsets[key] = offset
+            self._keys[offset] = key
+        return offset
+
+    def _samples(self, offset):
+        '''Return the (timestamp, value) samples of a slot, oldest
+           first.'''
+        written = _COUNT.unpack_from(self._map, offset + 8)[0]
+        start = offset + _SLOT.size
+        count = min(written, self.depth)
+        return [
+            _SAMPLE.unpack_from(
+                self._map, start + (i % self.depth) * _SAMPLE.size)
+            for i in range(written - count, written)
+        ]
+
+    def _append(self, offset, timestamp, value):
+        written = _COUNT.unpack_from(self._map, offset + 8)[0]
+        start = offset + _SLOT.size
+        if written:
+            newest = start + ((written - 1) % self.depth) * _SAMPLE.size
+            if _TIMESTAMP.unpack_from(self._map, newest)[0] == timestamp:
+                # Same poll recorded again
+                _SAMPLE.pack_into(self._map, newest, timestamp, value)
+                return
+        _SAMPLE.pack_into(self._map, start + (written % self.depth)
+                          * _SAMPLE.size, timestamp, value)
+        _COUNT.pack_into(self._map, offset + 8, written + 1)
+
+    def append(self, device, kind, instance, counter, timestamp, value):
+        '''Record one sample.'''
+        with self._lock:
+            offset = self._offset((device, kind, instance, counter),
+                                  create=True)
+            self._append(offset, timestamp, value)
+
+    def record(self, device, kind, timestamp, instances, columns):
+        '''Record a poll given as {counter: [value or None, ...]} with
+           values aligned to instances; None values are skipped.'''
+        columns = list(columns.items())
+        with self._lock:
+            for i, instance in enumerate(instances):
+                prefix = None
+                for counter, column in columns:
+                    value = column[i]
+                    if value is None:
+                        continue
+                    key = (device, kind, instance, counter)
+                    offset = self._offsets.get(key)
+                    if offset is None:
+                        if prefix is None:
+                            prefix = self._prefix(device, kind, instance)
+                        offset = self._offset(key, prefix, True)
+                    self._append(offset, timestamp, value)
+
+    def samples(self, device, kind, instance, counter):
+        '''Return the recorded (timestamp, value) samples, oldest
+           first.'''
+        with self._lock:
+            offset = self._offset((device, kind, instance, counter))
+            if offset is None:
+                return []
+            return self._samples(offset)
+
+    def last(self, device, kind, instance, counter):
+        samples = self.samples(device, kind, instance, counter)
+        return samples[-1] if samples else None
+
+    def previous(self, device, kind, instances, counters, before=None):
+        '''Return (timestamp, {counter: [value or None, ...]}) with the
+           latest poll recorded before timestamp before, aligned to
+           instances, or None when nothing was recorded.'''
+        found = {}
+        latest = None
+        with self._lock:
+            for i, instance in enumerate(instances):
+                prefix = self._prefix(device, kind, instance)
+                for counter in counters:
+                    offset = self._offset(
+                        (device, kind, instance, counter), prefix)
+                    if offset is None:
+                        continue
+                    for timestamp, value in reversed(self._samples(offset)):
+                        if before is None or timestamp < before:
+                            found[(i, counter)] = (timestamp, value)
+                            if latest is None or timestamp > latest:
+                                latest = timestamp
+                            break
+        if latest is None:
+            return None
+        columns = {}
+        for counter in counters:
+            column = [None] * len(instances)
+            for i in range(len(instances)):
+                sample = found.get((i, counter))
+                if sample is not None and sample[0] == latest:
+                    column[i] = sample[1]
+            columns[counter] = column
+        return latest, columns
+
+    def clear(self):
+        with self._lock:
+            self._offsets = {}
+            self._keys = {}
+            self._map[_HEADER_SIZE:] = b'\0' * (self.size - _HEADER_SIZE)
+
+    def flush(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._file.close()
+                self._map = None
+                self._file = None
+                self._offsets = {}
+                self._keys = {}
+
+
+# EOF
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import re
+
+from collections import namedtuple as NamedTuple
+
+from netapp_metrics.naming import graphite_name
+
+# Times are in seconds and sizes in bytes; parts of a call that could
+# not be measured (e.g. the split inside NaServer) are None.
+CallRecord = NamedTuple('CallRecord', [
+    'api', 'device', 'started', 'request_time', 'network_time',
+    'parse_time', 'total_time', 'request_bytes', 'response_bytes',
+    'records', 'error',
+])
+
+_API = re.compile(r'<\s*([\w-]+)')
+
+
+def api_name(cmd):
+    '''Return the ZAPI name of an NaElement or XML string.'''
+    if hasattr(cmd, 'element'):
+        return cmd.element['name']
+    match = _API.search(cmd)
+    return match.group(1) if match else '?'
+
+
+def record_count(res):
+    '''Return the record count an NaElement result reports, or None.'''
+    for name in ('num-records', 'records'):
+        value = res.child_get_string(name)
+        if value:
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    for name in ('instances', 'attributes-list'):
+        elem = res.child_get(name)
+        if elem is not None:
+            return len(elem.children_get())
+    return None
+
+
+class Histogram:
+    '''Fixed bucket histogram, cheap enough to update on every call.
+
+       Bucket bounds double from first up to first * 2 ** (buckets - 1);
+       percentiles are interpolated within their bucket.'''
+
+    def __init__(self, first=0.001, buckets=20):
+        self.bounds = [first * 2 ** i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        import threading
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        from bisect import bisect_left
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.bounds[index - 1] if index else 0.0
+                high = self.bounds[index] if index < len(self.bounds) \
+                    else self.max
+                value = low + (high - low) * (rank - seen) / count
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+class _Stats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.records = 0
+        self.response_bytes = 0
+        self.total_time = Histogram()
+        self.network_time = Histogram()
+        self.parse_time = Histogram()
+        self.response_size = Histogram(first=1024)
+        import threading
+        self.lock = threading.Lock()
+
+
+class Instrumentation:
+    '''Collects a CallRecord for every ZAPI call.
+
+       Records update per (device, api) histograms of the total,
+       network and parse time and the response size, then go to every
+       subscriber.  self_metrics() exports the aggregated figures as
+       flat metric names; last() is the latest record of the calling
+       thread.'''
+
+    def __init__(self):
+        self._subscribers = []
+        self._stats = {}
+        import threading
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def subscribe(self, callback):
+        '''Call callback(record) for every CallRecord.'''
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def record(self, record):
+        key = (record.device, record.api)
+        stats = self._stats.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(key, _Stats())
+        # Records come from many threads; the counters and histograms
+        # of a key are updated together so they always agree.
+        with stats.lock:
+            stats.calls += 1
+            if record.error:
+                stats.errors += 1
+            if record.records:
+                stats.records += record.records
+            stats.total_time.observe(record.total_time)
+            if record.network_time is not None:
+                stats.network_time.observe(record.network_time)
+            if record.parse_time is not None:
+                stats.parse_time.observe(record.parse_time)
+            if record.response_bytes is not None:
+                stats.response_bytes += record.response_bytes
+                stats.response_size.observe(record.response_bytes)
+        self._local.last = record
+        for subscriber in list(self._subscribers):
+            try:
+                subscriber(record)
+            except Exception:
+                # A broken subscriber must not break polling.
+                pass
+
+    def last(self):
+        return getattr(self._local, 'last', None)
+
+    def stats(self, device, api):
+        return self._stats.get((device, api))
+
+    def self_metrics(self, prefix='netapp_metrics'):
+        '''Return {metric name: value} for every device and api, e.g.
+           netapp_metrics.filer1.perf-object-get-instances.total_time.p95'''
+        metrics = {}
+        for (device, api), stats in list(self._stats.items()):
+            base = '%s.%s.%s' % (prefix, graphite_name(device), api)
+            with stats.lock:
+                metrics[base + '.calls'] = stats.calls
+                metrics[base + '.errors'] = stats.errors
+                metrics[base + '.records'] = stats.records
+                metrics[base + '.response_bytes'] = stats.response_bytes
+                for name in ('total_time', 'network_time', 'parse_time'):
+                    histogram = getattr(stats, name)
+                    if not histogram.count:
+                        continue
+                    for key, value in histogram.summary().items():
+                        if key != 'count':
+                            metrics['%s.%s.%s' % (base, name, key)] = value
+        return metrics
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+_default = {}
+
+
+def default_instrumentation():
+    '''Instrumentation shared by connections that were not given one.'''
+    try:
+        return _default['']
+    except KeyError:
+        return _default.setdefault('', Instrumentation())
+
+
+# EOF
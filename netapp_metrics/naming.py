@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import re
+import unicodedata
+
+_GRAPHITE_INVALID = re.compile(r'[^a-zA-Z0-9._]')
+_PROMETHEUS_INVALID = re.compile(r'[^a-zA-Z0-9_]')
+_PROMETHEUS_START = re.compile(r'^[^a-zA-Z_]')
+
+
+def _ascii(name):
+    if isinstance(name, bytes):
+        name = name.decode('utf-8', 'ignore')
+    name = unicodedata.normalize('NFKD', name)
+    return name.encode('ascii', 'ignore').decode('ascii')
+
+
+def graphite_name(name):
+    '''Dots become underscores and slashes become path separators, so
+       /vol/vol0 maps to vol.vol0.'''
+    name = _ascii(name)
+    name = name.replace('.', '_').strip('_')
+    name = name.replace('/', '.').strip('.')
+    return _GRAPHITE_INVALID.sub('_', name)
+
+
+def prometheus_name(name):
+    '''Safe as a Prometheus metric or label name.'''
+    name = _PROMETHEUS_INVALID.sub('_', _ascii(name).strip('/'))
+    if _PROMETHEUS_START.match(name):
+        name = '_' + name
+    return name
+
+
+def raw_name(name):
+    return _ascii(name)
+
+
+SCHEMES = {
+    'graphite': graphite_name,
+    'prometheus': prometheus_name,
+    'raw': raw_name,
+}
+
+
+def register_scheme(scheme, function):
+    '''Make function(name) available as a naming scheme.'''
+    SCHEMES[scheme] = function
+    _normalizers.pop(scheme, None)
+
+
+class NameNormalizer:
+    '''Memoized instance and counter name normalization.
+
+       Every unique name is converted once with the scheme's function;
+       the memo is cleared when it grows past max_size so memory stays
+       bounded when instances churn.  Counter names are only reduced to
+       ASCII, as they always were.'''
+
+    def __init__(self, scheme='graphite', max_size=200000):
+        if scheme not in SCHEMES:
+            raise ValueError('Unknown naming scheme: %s' % scheme)
+        self.scheme = scheme
+        self.max_size = max_size
+        self._function = SCHEMES[scheme]
+        self._instances = {}
+        self._counters = {}
+
+    def _lookup(self, memo, function, name):
+        try:
+            return memo[name]
+        except KeyError:
+            pass
+        if len(memo) >= self.max_size:
+            memo.clear()
+        value = memo[name] = function(name)
+        return value
+
+    def instance(self, name):
+        return self._lookup(self._instances, self._function, name)
+
+    def counter(self, name):
+        return self._lookup(self._counters, _ascii, name)
+
+    def clear(self):
+        self._instances.clear()
+        self._counters.clear()
+
+
+_normalizers = {}
+
+
+def get_normalizer(scheme='graphite'):
+    '''Return the normalizer shared by every connection for scheme.'''
+    try:
+        return _normalizers[scheme]
+    except KeyError:
+        # setdefault is atomic, so racing callers share one normalizer.
+        return _normalizers.setdefault(scheme, NameNormalizer(scheme))
+
+
+# EOF
@@ -12,7 +12,6 @@
 import sys
 import time
 import re
-import unicodedata
 import os
 import getopt
 import datetime
@@ -20,60 +19,209 @@ import datetime
 from collections import namedtuple as NamedTuple
 from string import Template
 
+from netapp_metrics.cache import InstanceCache, SchemaCache
+from netapp_metrics.decoder import DecodedResults, RecordStream, as_filter
+from netapp_metrics.instrument import (
+    CallRecord, api_name, default_instrumentation, record_count)
+from netapp_metrics.naming import get_normalizer
+from netapp_metrics.paging import AdaptivePager
+from netapp_metrics.rates import RateCalculator
+
+NaServer = None
 NETAPP_LIB_IMPORTED = False
-modulepaths = sys.path + ['/opt', '/usr/local', os.getcwd()]
+NETAPP_LIB_ENV = 'NETAPP_LIB_PATH'
+NETAPP_CACHE_ENV = 'NETAPP_METRICS_CACHE'
+
+
+def _cache_dir():
+    '''Directory used to persist discovery and schema caches.'''
+    path = os.environ.get(NETAPP_CACHE_ENV)
+    if not path:
+        base = os.environ.get('XDG_CACHE_HOME') or \
+            os.path.join(os.path.expanduser('~'), '.cache')
+        path = os.path.join(base, 'netapp_metrics')
+    return path
+
+
+def _location_cache():
+    return os.path.join(_cache_dir(), 'naserver_path')
+
+
+def _valid_location(path):
+    return bool(path) and os.path.isfile(os.path.join(path, 'NaServer.py'))
+
 
-try:
-    import NaServer
-    NETAPP_LIB_IMPORTED = True
-except ImportError:
+def _read_location():
+    try:
+        with open(_location_cache()) as cache:
+            return cache.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def _write_location(path):
+    try:
+        if not os.path.isdir(_cache_dir()):
+            os.makedirs(_cache_dir())
+        with open(_location_cache(), 'w') as cache:
+            cache.write(path)
+    except (IOError, OSError):
+        pass
+
+
+def _import_from(path):
+    global NaServer
+    if path not in sys.path:
+        sys.path.append(path)
+    try:
+        import NaServer as module
+    except ImportError:
+        return None
+    NaServer = module
+    return module
+
+
+def _walk_for_naserver():
+    '''Slow path: walk sys.path, /opt, /usr/local and the CWD.'''
+    modulepaths = sys.path + ['/opt', '/usr/local', os.getcwd()]
     for path in modulepaths:
         if not os.path.isdir(path):
             path = os.path.dirname(path)
         if os.path.isdir(path):
             for root, dirs, files in os.walk(path):
                 if 'NaServer.py' in files:
-                    if root not in sys.path:
-                        sys.path.append(root)
-                        try:
-                            import NaServer
-                            NETAPP_LIB_IMPORTED = True
-                            break
-                        except ImportError:
-                            pass
-
-
-if NETAPP_LIB_IMPORTED:
-    NaServer  # workaround for pyflakes issue #13
-else:
+                    return root
+    return None
+
+
+def _load_naserver(path=None):
+    '''Locate and import the NetApp OnTAP API library on first use.
+
+       Lookup order is: an already imported module, an explicit path, the
+       NETAPP_LIB_PATH environment variable, a plain import, the cached
+       location from a previous run and finally a filesystem walk.  The
+       cached location is validated before use and rebuilt when stale.'''
+    global NaServer, NETAPP_LIB_IMPORTED
+    if NaServer is not None:
+        return NaServer
+    for candidate in (path, os.environ.get(NETAPP_LIB_ENV)):
+        if _valid_location(candidate) and _import_from(candidate):
+            NETAPP_LIB_IMPORTED = True
+            return NaServer
+    try:
+        import NaServer as module
+        NaServer = module
+        NETAPP_LIB_IMPORTED = True
+        return NaServer
+    except ImportError:
+        pass
+    cached = _read_location()
+    if _valid_location(cached) and _import_from(cached):
+        NETAPP_LIB_IMPORTED = True
+        return NaServer
+    found = _walk_for_naserver()
+    if found and _import_from(found):
+        _write_location(found)
+        NETAPP_LIB_IMPORTED = True
+        return NaServer
     raise ImportError('Unable to locate NetApp OnTAP API library in various '
-        'paths and subdirectories: %s' % modulepaths)
+        'paths and subdirectories, set %s to its location' % NETAPP_LIB_ENV)
+
+
+_default_schema_cache = None
+_default_pager = None
+
+
+def default_schema_cache():
+    '''Process wide schema cache persisted under the cache directory.'''
+    global _default_schema_cache
+    if _default_schema_cache is None:
+        _default_schema_cache = SchemaCache(
+            os.path.join(_cache_dir(), 'schemas'))
+    return _default_schema_cache
+
+
+def default_pager():
+    '''Process wide adaptive pager.  Tuned page sizes are saved to
+       page_sizes.json under the cache directory (see
+       NETAPP_METRICS_CACHE) and reused after a restart; pass pager=False
+       to NetAppMetrics for fixed pages or an AdaptivePager without a
+       path to keep them in memory.'''
+    global _default_pager
+    if _default_pager is None:
+        _default_pager = AdaptivePager(
+            path=os.path.join(_cache_dir(), 'page_sizes.json'))
+    return _default_pager
+
 
 class NetAppMetrics:
 
-    def __init__(self, device, user, password, timeout=None, vserver='', max_records=999):
+    def __init__(self, device, user, password, timeout=None, vserver='',
+                 max_records=None, lib_path=None, schema_cache=None,
+                 instance_cache=None, instance_refresh=300,
+                 chunk_size=None, chunk_workers=4, naming='graphite',
+                 port=None, inventory_max_records=999, pool_size=None,
+                 instrumentation=None, pager=None, decode_pool=None,
+                 history=None, decode_arrays=False):
+        _load_naserver(lib_path)
+        if schema_cache is None:
+            schema_cache = default_schema_cache()
+        self.schema_cache = schema_cache or None
+        if instance_cache is None:
+            instance_cache = InstanceCache(instance_refresh)
+        self.instance_cache = instance_cache
         self.vserver = None
         self.device = None
         self.clustered = False
         self.generation = '0'
         self.major = '0'
         self.minor = '0'
-        self.perf_max_records = max_records
-        self._connect(device, user, password, timeout)
+        # An explicit max_records caps the tuned page size.
+        self.max_records = max_records
+        self.perf_max_records = 999 if max_records is None else max_records
+        if pager is None:
+            pager = default_pager()
+        self.pager = pager or None
+        self.inventory_max_records = inventory_max_records
+        self.pooled = pool_size is not None
+        if instrumentation is None:
+            instrumentation = default_instrumentation()
+        self.instrumentation = instrumentation
+        self.pool_size = pool_size or 1
+        self.chunk_size = chunk_size
+        self.chunk_workers = chunk_workers
+        self.chunk_errors = []
+        self._attribute_path_cache = {}
+        self.rates = RateCalculator(history=history)
+        self.naming = naming
+        self.names = get_normalizer(naming)
+        self.decode_pool = decode_pool
+        self.decode_arrays = decode_arrays
+        self._array_label_cache = {}
+        self._connect(device, user, password, timeout, port=port)
         self._set_vserver(vserver)
         self._get_version()
 
-    def _connect(self, device, user, password, timeout=None, method='HTTP'):
+    def _connect(self, device, user, password, timeout=None, method='HTTP',
+                 port=None):
         self.server = NaServer.NaServer(device, 1, 15)
         self.server.set_transport_type(method)
         self.server.set_style('LOGIN')
         self.server.set_admin_user(user, password)
+        if port is not None:
+            self.server.set_port(port)
         if timeout is not None:
             self.server.set_timeout(timeout)
+        from netapp_metrics.transport import ZapiTransport
+        self.transport = ZapiTransport(
+            device, user, password, method, port, timeout,
+            pool_size=self.pool_size, element_class=NaServer.NaElement,
+            observer=self.instrumentation.record)
         self.device = device
 
     def _set_vserver(self, vserver=''):
         self.server.set_vserver(vserver)
+        self.transport.vserver = vserver
         self.vserver = vserver
 
     def _get_version(self):
@@ -102,7 +250,27 @@ class NetAppMetrics:
                     self.minor = version_tuple.group(3)
             return (self.generation, self.major, self.minor)
 
+    def _schema_key(self):
+        return (self.clustered, self.generation, self.major, self.minor)
+
+    def _cached_schema(self, api, kind=''):
+        if self.schema_cache is None:
+            return None
+        value = self.schema_cache.get(
+            self.device, self._schema_key(), api, kind)
+        if value is not None:
+            return dict(value)
+        return None
+
+    def _cache_schema(self, api, kind, value):
+        if self.schema_cache is not None:
+            self.schema_cache.set(
+                self.device, self._schema_key(), api, kind, dict(value))
+
     def get_objects(self):
+        objects = self._cached_schema('perf-object-list-info')
+        if objects is not None:
+            return objects
         cmd = NaServer.NaElement('perf-object-list-info')
         res = self._invoke_elem(cmd)
         objects = {}
@@ -115,12 +283,16 @@ class NetAppMetrics:
                 inst_desc = inst.child_get_string("description")
                 inst_priv = inst.child_get_string("privilege-level")
                 objects[inst_name] = (inst_desc, inst_priv)
+        self._cache_schema('perf-object-list-info', '', objects)
         return objects
 
     def get_info(self, kind):
+        counters = self._cached_schema('perf-object-counter-list-info', kind)
+        if counters is not None:
+            return counters
         cmd = NaServer.NaElement("perf-object-counter-list-info")
         cmd.child_add_string("objectname", kind)
-        res = self.server._invoke_elem(cmd)
+        res = self._server_invoke(cmd)
         counters = {}
         if res.results_errno():
             reason = res.results_reason()
@@ -146,6 +318,7 @@ class NetAppMetrics:
                     tlabels = clabels.child_get_string("label-info")
                     labels = [l.strip() for l in tlabels.split(',')]
             counters[name] = (unit, properties, base, priv, desc, labels)
+        self._cache_schema('perf-object-counter-list-info', kind, counters)
         return counters
 
     def _invoke(self, cmd):
@@ -155,9 +328,72 @@ class NetAppMetrics:
     def _invoke_elem(self, cmd):
         '''Expose underlying NetApp API for element invoking'''
         if isinstance(cmd, NaServer.NaElement):
-            return self.server.invoke_elem(cmd)
+            if self.pooled:
+                return self.transport.invoke_elem(cmd)
+            return self._timed(self.server.invoke_elem, cmd)
         raise TypeError('Provided cmd is not of type NaElement')
 
+    def _server_invoke(self, cmd):
+        '''Invoke cmd over the pooled transport when pool_size was
+           given, NaServer otherwise.'''
+        if self.pooled:
+            return self.transport.invoke_elem(cmd)
+        return self._timed(self.server._invoke_elem, cmd)
+
+    def _timed(self, invoke, cmd):
+        '''Report an NaServer call to the instrumentation; NaServer does
+           not expose its request/network/parse split.'''
+        started = time.time()
+        res = None
+        error = None
+        try:
+            res = invoke(cmd)
+            if res.results_errno():
+                error = res.results_reason()
+            return res
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            raise
+        finally:
+            self.instrumentation.record(CallRecord(
+                api_name(cmd), self.device, started, None, None, None,
+                time.time() - started, None, None,
+                None if res is None else record_count(res), error))
+
+    def _perf_invoke(self, cmd):
+        '''Invoke a perf instances call, decoding the response in the
+           decode_pool processes when one is set.  The raw body is always
+           fetched over the transport then, pooled or not.'''
+        if self.decode_pool is None:
+            return self._server_invoke(cmd)
+        return self.decode_pool.decode(
+            self.transport.request(cmd), self.naming)
+
+    def _page_size(self, kind, api):
+        if self.pager is None:
+            return self.perf_max_records
+        size = self.pager.size(self.device, kind, api, self.perf_max_records)
+        if self.max_records is not None:
+            size = min(size, self.max_records)
+        return size
+
+    def _page_invoke(self, cmd, kind, api, maximum, invoke=None):
+        '''Invoke a perf iterator page and feed its latency and size
+           back to the pager.'''
+        started = time.time()
+        res = (invoke or self._server_invoke)(cmd)
+        if self.pager is not None and not res.results_errno():
+            returned = record_count(res) or 0
+            last = self.instrumentation.last()
+            size = last.response_bytes if last is not None else None
+            self.pager.observe(self.device, kind, api, maximum, returned,
+                               time.time() - started, size)
+        return res
+
+    def close(self):
+        '''Close the idle pooled connections.'''
+        self.transport.close()
+
     def _decode_elements2dict(self, head, filter=None):
         '''This function is a function that can take the results from
            an invoke call from the NetApp API and break it down to a
@@ -210,71 +446,173 @@ class NetAppMetrics:
         else:
             return head.element
 
-    def get_lun_info(self, filter=None):
-        cmd = NaServer.NaElement('lun-list-info')
-        if self.clustered:
-            cmd = NaServer.NaElement('lun-get-iter')
-            cmd.child_add_string("max-records", "999")
-        res = self._invoke_elem(cmd)
-        if res.results_errno():
-            raise ValueError('lun-info error: %s' % res.results_reason())
-        answers = self._decode_elements2dict(res, filter)
-        if self.clustered:
-            return [item['lun-info'] for item in answers['attributes-list']]
-        return [item['lun-info'] for item in answers['luns']]
+    def _iter_records(self, cmd, container, filter, error, info=None,
+                      paths=None):
+        '''Stream the decoded records of a list call, see RecordStream.'''
+        with self.transport.stream(cmd) as response:
+            stream = RecordStream(response, container, filter, error, paths)
+            response.records = 0
+            for record in stream:
+                response.records += 1
+                yield record
+        if info is not None:
+            info.update(stream.info)
 
-    def get_vol_space_info(self, filter=None):
-        cmd = NaServer.NaElement('volume-get-iter')
-        if self.clustered:
-            cmd.child_add_string("max-records", "999")
-        else:
-            cmd = NaServer.NaElement('volume-list-info')
+    def _attribute_paths(self, api):
+        paths = self._cached_schema('desired-attributes', api)
+        if paths is None:
+            paths = self._attribute_path_cache.get(api)
+        if paths is None:
+            return None
+        return set(tuple(path.split('/')) for path in paths)
 
-        res = self._invoke_elem(cmd)
-        if res.results_errno():
-            raise ValueError(
-                'vol-space-info error: %s' % res.results_reason())
+    def _store_attribute_paths(self, api, paths):
+        paths = set(paths) | (self._attribute_paths(api) or set())
+        paths = dict(('/'.join(path), ()) for path in paths)
+        self._attribute_path_cache[api] = paths
+        self._cache_schema('desired-attributes', api, paths)
 
-        answers = self._decode_elements2dict(res, filter)
-        ret = []
+    def _desired_attributes(self, api, filter):
+        '''Build the desired-attributes projection of filter for api
+           from the leaf paths seen in earlier responses, or None when
+           the paths are not known yet or a field was never seen.
 
-        if self.clustered:
-            for i in answers['attributes-list']:
-                ans = {}
-                for j in i:
-                    if not hasattr(j, 'iteritems'):
-                        j = j[0]
-                    for key, item in j.iteritems():
-                        ans[key] = item
-                ret.append(ans)
-            return ret
-        else:
-            return answers[0]
+           Leaves whose parent also holds containers are requested
+           unconditionally since _decode_elements2dict never filtered
+           them, and one leaf is kept in every other container so it
+           still decodes to an empty dict rather than going missing.
+           Projected records therefore match unprojected ones as long
+           as every container was seen while learning; the learned
+           paths expire with the schema cache ttl and are learned
+           again.'''
+        filter = as_filter(filter)
+        paths = self._attribute_paths(api)
+        if filter is None or not paths:
+            return None
+        if not filter <= set(path[-1] for path in paths):
+            return None
+        leaf_parents = set(path[:-1] for path in paths)
+        node_parents = set(
+            path[:i] for path in paths for i in range(1, len(path) - 1))
+        mixed = leaf_parents & node_parents
+        wanted = set(
+            path for path in paths
+            if path[-1] in filter or path[:-1] in mixed)
+        for container in sorted(leaf_parents | node_parents):
+            below = [p for p in paths if p[:len(container)] == container]
+            if not any(p[:len(container)] == container for p in wanted):
+                wanted.add(min(below))
+        tree = {}
+        for path in wanted:
+            node = tree
+            for name in path:
+                node = node.setdefault(name, {})
+        desired = NaServer.NaElement('desired-attributes')
+        stack = [(desired, tree)]
+        while stack:
+            parent, node = stack.pop()
+            for name in sorted(node):
+                child = NaServer.NaElement(name)
+                parent.child_add(child)
+                stack.append((child, node[name]))
+        return desired
+
+    def _iter_pages(self, api, filter, page_size, error):
+        '''Yield the records of a C-mode *-get-iter call page by page,
+           following next-tag, with filter sent as desired-attributes.
+
+           When the attribute layout is not known yet every page of the
+           call is fetched unprojected and its leaf paths are learned,
+           so containers only present in later records are known too.
+           The learned paths are written through the schema cache.'''
+        if page_size is None:
+            page_size = self.inventory_max_records
+        next_tag = None
+        learned = None
+        try:
+            while True:
+                cmd = NaServer.NaElement(api)
+                cmd.child_add_string("max-records", page_size)
+                if next_tag:
+                    cmd.child_add_string("tag", next_tag)
+                desired = None
+                if learned is None:
+                    desired = self._desired_attributes(api, filter)
+                if desired is not None:
+                    cmd.child_add(desired)
+                elif filter is not None and learned is None:
+                    learned = set()
+                info = {}
+                for record in self._iter_records(
+                        cmd, 'attributes-list', filter, error, info,
+                        learned):
+                    yield record
+                if learned:
+                    self._store_attribute_paths(api, learned)
+                next_tag = info.get('next-tag')
+                if not next_tag:
+                    break
+        finally:
+            if learned and self.schema_cache is not None:
+                self.schema_cache.flush()
 
-    def get_aggr_info(self, filter=None):
-        cmd = NaServer.NaElement('aggr-get-iter')
+    def iter_lun_info(self, filter=None, page_size=None):
+        '''Yield the decoded lun-info of every lun as it is parsed.
+           On C-mode all pages of page_size records are fetched.'''
+        error = 'lun-info error: %s'
         if self.clustered:
-            cmd.child_add_string("max-records", "999")
+            records = self._iter_pages(
+                'lun-get-iter', filter, page_size, error)
         else:
-            cmd = NaServer.NaElement('aggr-list-info')
+            records = self._iter_records(
+                NaServer.NaElement('lun-list-info'), 'luns', filter, error)
+        for item in records:
+            yield item['lun-info']
 
-        res = self._invoke_elem(cmd)
+    def get_lun_info(self, filter=None, page_size=None):
+        return list(self.iter_lun_info(filter, page_size))
 
-        if res.results_errno():
-            raise ValueError('aggr-info error: %s' % res.results_reason())
+    def iter_vol_space_info(self, filter=None, page_size=None):
+        '''Yield the decoded attributes of every volume as it is parsed.
+           On C-mode all pages of page_size records are fetched.'''
+        error = 'vol-space-info error: %s'
+        if not self.clustered:
+            for item in self._iter_records(
+                    NaServer.NaElement('volume-list-info'), 'volumes',
+                    filter, error):
+                yield item
+            return
 
-        answers = self._decode_elements2dict(res, filter)
+        for i in self._iter_pages('volume-get-iter', filter, page_size, error):
+            ans = {}
+            for j in i:
+                if not isinstance(j, dict):
+                    j = j[0]
+                for key, item in j.items():
+                    ans[key] = item
+            yield ans
 
-        if not self.clustered:
-            return answers[0]
+    def get_vol_space_info(self, filter=None, page_size=None):
+        return list(self.iter_vol_space_info(filter, page_size))
+
+    def iter_aggr_info(self, filter=None, page_size=None):
+        '''Yield the decoded attributes of every aggregate as it is
+           parsed.  On C-mode all pages of page_size records are
+           fetched.'''
+        error = 'aggr-info error: %s'
+        if self.clustered:
+            return self._iter_pages('aggr-get-iter', filter, page_size, error)
+        return self._iter_records(
+            NaServer.NaElement('aggr-list-info'), 'aggregates', filter, error)
 
-        return answers['attributes-list']
+    def get_aggr_info(self, filter=None, page_size=None):
+        return list(self.iter_aggr_info(filter, page_size))
 
     def __sevenm_instances(self, kind, filter=''):
         instances_list = []
         cmd = NaServer.NaElement("perf-object-instance-list-info-iter-start")
         cmd.child_add_string("objectname", kind)
-        res = self.server._invoke_elem(cmd)
+        res = self._server_invoke(cmd)
         if res.results_errno():
             reason = res.results_reason()
             msg = (
@@ -283,20 +621,20 @@ class NetAppMetrics:
                   )
             raise ValueError(msg % (kind, reason))
         next_tag = res.child_get_string("tag")
-        counter = self.perf_max_records
-        while counter == self.perf_max_records:
-            cmd = NaServer.NaElement(
-                "perf-object-instance-list-info-iter-next"
-            )
+        api = "perf-object-instance-list-info-iter-next"
+        records = 1
+        while records:
+            cmd = NaServer.NaElement(api)
+            maximum = self._page_size(kind, api)
             cmd.child_add_string("tag", next_tag)
-            cmd.child_add_string("maximum", self.perf_max_records)
-            res = self.server._invoke_elem(cmd)
+            cmd.child_add_string("maximum", maximum)
+            res = self._page_invoke(cmd, kind, api, maximum)
             if res.results_errno():
                 reason = res.results_reason()
                 msg = ("perf-object-instance-list-info-iter-next"
                        " cannot collect '%s': %s")
                 raise ValueError(msg % (kind, reason))
-            counter = res.child_get_string("records")
+            records = int(res.child_get_string("records") or 0)
             instances = res.child_get("instances")
             if instances:
                 for inst in instances.children_get():
@@ -304,7 +642,7 @@ class NetAppMetrics:
                     instances_list.append(name)
         cmd = NaServer.NaElement("perf-object-instance-list-info-iter-end")
         cmd.child_add_string("tag", next_tag)
-        res = self.server._invoke_elem(cmd)
+        res = self._server_invoke(cmd)
         if res.results_errno():
             reason = res.results_reason()
             msg = (
@@ -316,19 +654,20 @@ class NetAppMetrics:
         # filter
         return instances_list
 
-    def __clusterm_instances(self, kind, filter=''):
-        counter = self.perf_max_records
+    def __clusterm_instances(self, kind, filter='', names=None):
+        api = "perf-object-instance-list-info-iter"
         next_tag = ''
         instances_list = []
-        while counter == self.perf_max_records:
-            cmd = NaServer.NaElement("perf-object-instance-list-info-iter")
+        while True:
+            cmd = NaServer.NaElement(api)
+            maximum = self._page_size(kind, api)
             cmd.child_add_string("objectname", kind)
             if filter:
                 cmd.child_add_string("filter-data", filter)
             if next_tag:
                 cmd.child_add_string("tag", next_tag)
-            cmd.child_add_string("max-records", self.perf_max_records)
-            res = self.server._invoke_elem(cmd)
+            cmd.child_add_string("max-records", maximum)
+            res = self._page_invoke(cmd, kind, api, maximum)
             if res.results_errno():
                 reason = res.results_reason()
                 msg = (
@@ -337,10 +676,15 @@ class NetAppMetrics:
                 )
                 raise ValueError(msg % (kind, reason))
             next_tag = res.child_get_string("next-tag")
-            counter = res.child_get_string("num-records")
-            for inst in res.child_get("attributes-list").children_get():
-                name = inst.child_get_string("uuid")
-                instances_list.append(name)
+            attributes = res.child_get("attributes-list")
+            if attributes:
+                for inst in attributes.children_get():
+                    name = inst.child_get_string("uuid")
+                    instances_list.append(name)
+                    if names is not None:
+                        names[name] = inst.child_get_string("name")
+            if not next_tag:
+                break
         return instances_list
 
     def get_instances(self, kind, filter=''):
@@ -349,29 +693,50 @@ class NetAppMetrics:
         else:
             return self.__sevenm_instances(kind, filter)
 
-    def __collect_instances(self, response):
-        metrics = {}
-        times = {}
+    def get_instance_names(self, kind, filter=''):
+        '''Return {instance: name} for the instances of kind; on C-mode
+           instances are uuids, on 7-mode they are their own names.'''
+        if self.clustered:
+            names = {}
+            self.__clusterm_instances(kind, filter, names)
+            return names
+        return dict(
+            (name, name) for name in self.__sevenm_instances(kind, filter))
+
+    def get_cached_instances(self, kind, filter='', refresh=False):
+        '''Return an InstanceSet with the instances of kind, their names
+           and the instances added and removed by the last enumeration.
+           The list is re-enumerated every instance_refresh seconds.'''
+        return self.instance_cache.get(
+            self.device, kind, filter,
+            lambda: self.get_instance_names(kind, filter), refresh)
+
+    def __iter_instances(self, response):
+        '''Yield (name, counters) for every instance of a response.'''
+        if isinstance(response, DecodedResults):
+            for name, instance_data in response.instances:
+                yield name, instance_data
+            return
+        counter_name = self.names.counter
+        instance_name = self.names.instance
         for instance in response.child_get("instances").children_get():
             instance_data = {}
             counters_list = instance.child_get("counters").children_get()
             for counter in counters_list:
-                raw_metricname = counter.child_get_string("name")
-                raw_metricname = unicodedata.normalize('NFKD', raw_metricname)
-                metric = raw_metricname.encode('ascii', 'ignore')
+                metric = counter_name(counter.child_get_string("name"))
                 instance_data[metric] = counter.child_get_string("value")
             # get a instance name
             if instance.child_get_string("uuid"):
                 name = instance.child_get_string("uuid")
             else:
                 name = instance.child_get_string("name")
-            name = unicodedata.normalize('NFKD', name)
-            # Optimize please!!!!!
-            name = name.encode('ascii', 'ignore')
-            name = name.replace('.', '_').strip('_')
-            name = name.replace('/', '.').strip('.')
-            name = re.sub(r'[^a-zA-Z0-9._]', '_', name)
-            # name = re.sub(r'[^a-zA-Z0-9_]', '_', name)
+            name = instance_name(name)
+            yield name, instance_data
+
+    def __collect_instances(self, response):
+        metrics = {}
+        times = {}
+        for name, instance_data in self.__iter_instances(response):
             metrics[name] = instance_data
             # Keep track of how long has passed since we checked last
             times[name] = time.time()
@@ -380,9 +745,7 @@ class NetAppMetrics:
             instance_time = float(response.child_get_string("timestamp"))
         return metrics, times, instance_time
 
-    def __sevenm_metrics(self, kind, instances, metrics):
-        values = {}
-        times = {}
+    def __sevenm_iter_metrics(self, kind, instances, metrics):
         cmd = NaServer.NaElement("perf-object-get-instances-iter-start")
         cmd.child_add_string("objectname", kind)
         counters = NaServer.NaElement("counters")
@@ -393,7 +756,7 @@ class NetAppMetrics:
         for inst in instances:
             insts.child_add_string("instance", inst)
         cmd.child_add(insts)
-        res = self.server._invoke_elem(cmd)
+        res = self._server_invoke(cmd)
         if res.results_errno():
             reason = res.results_reason()
             msg = (
@@ -403,43 +766,84 @@ class NetAppMetrics:
             raise ValueError(msg % (kind, reason))
         next_tag = res.child_get_string("tag")
         instance_time = float(res.child_get_string("timestamp"))
-        counter = self.perf_max_records
-        while counter == self.perf_max_records:
-            cmd = NaServer.NaElement("perf-object-get-instances-iter-next")
-            cmd.child_add_string("tag", next_tag)
-            cmd.child_add_string("maximum", self.perf_max_records)
-            res = self.server._invoke_elem(cmd)
-            if res.results_errno():
-                reason = res.results_reason()
-                msg = (
-                        "perf-object-get-instances-iter-next"
-                        " cannot collect '%s': %s"
-                )
-                raise ValueError(msg % (kind, reason))
-            counter = res.child_get_string("records")
-            partial_values, partial_times, partial_inst_t \
-                = self.__collect_instances(res)
-            # Mix them with the previous records of the same instance
-            # WARNING, BUG with same instance and time!!!!!!!!!
-            for instance, values in values.iteritems():
-                if instance in partial_values:
-                    values.update(partial_values[instance])
-                    del partial_values[instance]
-            values.update(partial_values)
-            times.update(partial_times)
-        cmd = NaServer.NaElement("perf-object-instance-list-info-iter-end")
+        completed = False
+        try:
+            # An instance with more counters than fit in a page continues
+            # at the start of the next one, so the last instance of every
+            # page is held back until the following record is seen.
+            pending_name = None
+            pending_data = None
+            api = "perf-object-get-instances-iter-next"
+            records = 1
+            while records:
+                cmd = NaServer.NaElement(api)
+                maximum = self._page_size(kind, api)
+                cmd.child_add_string("tag", next_tag)
+                cmd.child_add_string("maximum", maximum)
+                res = self._page_invoke(
+                    cmd, kind, api, maximum, self._perf_invoke)
+                if res.results_errno():
+                    reason = res.results_reason()
+                    msg = (
+                            "perf-object-get-instances-iter-next"
+                            " cannot collect '%s': %s"
+                    )
+                    raise ValueError(msg % (kind, reason))
+                records = int(res.child_get_string("records") or 0)
+                if not records:
+                    break
+                for name, instance_data in self.__iter_instances(res):
+                    if name == pending_name:
+                        pending_data.update(instance_data)
+                        continue
+                    if pending_name is not None:
+                        yield pending_name, pending_data, instance_time
+                    pending_name = name
+                    pending_data = instance_data
+            if pending_name is not None:
+                yield pending_name, pending_data, instance_time
+            completed = True
+        finally:
+            # Closing the iterator is best effort: a failure is only
+            # raised when nothing else went wrong and the consumer read
+            # every record, never over an iter-next error or from
+            # generator close().
+            error = self.__sevenm_iter_end(kind, next_tag)
+            if error is not None and completed:
+                raise error
+
+    def __sevenm_iter_end(self, kind, next_tag):
+        '''End a perf-object-get-instances iterator and return the error
+           it failed with, if any.'''
+        cmd = NaServer.NaElement("perf-object-get-instances-iter-end")
         cmd.child_add_string("tag", next_tag)
-        res = self.server._invoke_elem(cmd)
+        try:
+            res = self._server_invoke(cmd)
+        except Exception as e:
+            return e
         if res.results_errno():
             reason = res.results_reason()
             msg = (
-                    "perf-object-instance-list-info-iter-end"
+                    "perf-object-get-instances-iter-end"
                     " cannot collect '%s': %s"
             )
-            raise ValueError(msg % (kind, reason))
+            return ValueError(msg % (kind, reason))
+        return None
+
+    def __sevenm_metrics(self, kind, instances, metrics):
+        values = {}
+        times = {}
+        instance_time = None
+        for name, instance_data, instance_time in self.__sevenm_iter_metrics(
+                kind, instances, metrics):
+            if name in values:
+                values[name].update(instance_data)
+            else:
+                values[name] = instance_data
+            times[name] = time.time()
         return values, times, instance_time
 
-    def __clusterm_metrics(self, kind, instances, metrics):
+    def __clusterm_response(self, kind, instances, metrics):
         cmd = NaServer.NaElement("perf-object-get-instances")
         inst = NaServer.NaElement("instance-uuids")
         for instance in instances:
@@ -450,18 +854,212 @@ class NetAppMetrics:
         for metric in metrics:
             counters.child_add_string("counter", metric)
         cmd.child_add(counters)
-        res = self.server._invoke_elem(cmd)
+        res = self._perf_invoke(cmd)
         if res.results_errno():
             reason = res.results_reason()
             msg = "perf-object-get-instances cannot collect '%s': %s"
             raise ValueError(msg % (kind, reason))
-        return self.__collect_instances(res)
+        return res
+
+    def __clusterm_request(self, kind, instances, metrics):
+        return self.__collect_instances(
+            self.__clusterm_response(kind, instances, metrics))
+
+    def _chunk_instances(self, kind, instances, metrics):
+        '''Split instances so that instances x counters of each chunk
+           stays within chunk_size.'''
+        instances = list(instances)
+        counters = len(metrics) or len(self.get_info(kind)) or 1
+        per_chunk = max(1, self.chunk_size // counters)
+        return [
+            instances[i:i + per_chunk]
+            for i in range(0, len(instances), per_chunk)
+        ]
+
+    def __clusterm_run_chunks(self, kind, chunks, metrics):
+        '''Yield (chunk, result or exception) as chunks complete.'''
+        def collect(chunk):
+            try:
+                return chunk, self.__clusterm_request(kind, chunk, metrics)
+            except Exception as e:
+                return chunk, e
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(max(1, min(self.chunk_workers, len(chunks))))
+        try:
+            for result in pool.imap_unordered(collect, chunks):
+                yield result
+        finally:
+            pool.terminate()
+
+    def __clusterm_chunks(self, kind, instances, metrics):
+        self.chunk_errors = []
+        if self.chunk_size:
+            return self._chunk_instances(kind, instances, metrics)
+        return [instances]
+
+    def __clusterm_metrics(self, kind, instances, metrics):
+        chunks = self.__clusterm_chunks(kind, instances, metrics)
+        if len(chunks) <= 1:
+            return self.__clusterm_request(kind, instances, metrics)
+        values = {}
+        times = {}
+        instance_time = None
+        errors = []
+        for chunk, result in self.__clusterm_run_chunks(
+                kind, chunks, metrics):
+            if isinstance(result, Exception):
+                errors.append((chunk, result))
+                continue
+            partial_values, partial_times, partial_inst_t = result
+            values.update(partial_values)
+            times.update(partial_times)
+            if partial_inst_t is not None:
+                instance_time = max(instance_time or 0, partial_inst_t)
+        self.chunk_errors = errors
+        if errors and len(errors) == len(chunks):
+            raise errors[0][1]
+        return values, times, instance_time
+
+    def __clusterm_iter_metrics(self, kind, instances, metrics):
+        chunks = self.__clusterm_chunks(kind, instances, metrics)
+        if len(chunks) <= 1:
+            res = self.__clusterm_response(kind, instances, metrics)
+            instance_time = None
+            if res.child_get_string("timestamp"):
+                instance_time = float(res.child_get_string("timestamp"))
+            for name, instance_data in self.__iter_instances(res):
+                yield name, instance_data, instance_time
+            return
+        results = self.__clusterm_run_chunks(kind, chunks, metrics)
+        errors = []
+        for chunk, result in results:
+            if isinstance(result, Exception):
+                errors.append((chunk, result))
+                self.chunk_errors = errors
+                continue
+            values, _, instance_time = result
+            for name, instance_data in values.items():
+                yield name, instance_data, instance_time
+        if errors and len(errors) == len(chunks):
+            raise errors[0][1]
 
     def get_metrics(self, kind, instances, metrics=[]):
+        '''Return (metrics, times, instance_time) for instances of kind.
+
+           On C-mode with chunk_size set, instances are requested in
+           chunks of at most chunk_size instances x counters on up to
+           chunk_workers threads.  Chunks that fail are listed in
+           chunk_errors as (instances, exception) and left out of the
+           result; the call only raises when every chunk failed.  With
+           decode_arrays set, array counters are LabeledArray values
+           instead of comma separated strings.'''
         if self.clustered:
-            return self.__clusterm_metrics(kind, instances, metrics)
+            result = self.__clusterm_metrics(kind, instances, metrics)
         else:
-            return self.__sevenm_metrics(kind, instances, metrics)
+            result = self.__sevenm_metrics(kind, instances, metrics)
+        if self.decode_arrays:
+            self._decode_arrays(kind, result[0].items())
+        return result
+
+    def __iter_metrics(self, kind, instances, metrics):
+        if self.clustered:
+            return self.__clusterm_iter_metrics(kind, instances, metrics)
+        else:
+            return self.__sevenm_iter_metrics(kind, instances, metrics)
+
+    def __iter_decoded_metrics(self, kind, instances, metrics):
+        for record in self.__iter_metrics(kind, instances, metrics):
+            self._decode_arrays(kind, (record[:2],))
+            yield record
+
+    def iter_metrics(self, kind, instances, metrics=[]):
+        '''Generator variant of get_metrics yielding one
+           (name, counters, instance_time) record per instance as soon
+           as its page (7-mode) or chunk (C-mode) arrives.  Instances
+           split across 7-mode pages are merged before being yielded,
+           and only one page is held in memory at a time.'''
+        if self.decode_arrays:
+            return self.__iter_decoded_metrics(kind, instances, metrics)
+        return self.__iter_metrics(kind, instances, metrics)
+
+    def array_labels(self, kind):
+        '''Return {counter: labels} for the array counters of kind,
+           with counter names as get_metrics returns them.'''
+        labels = self._array_label_cache.get(kind)
+        if labels is None:
+            labels = dict(
+                (self.names.counter(name), tuple(info[5]))
+                for name, info in self.get_info(kind).items() if info[5])
+            self._array_label_cache[kind] = labels
+        return labels
+
+    def _decode_arrays(self, kind, records):
+        '''Replace array counter strings by LabeledArray values in
+           (name, counters) records.'''
+        labels = self.array_labels(kind)
+        if not labels:
+            return
+        from netapp_metrics.arrays import LabeledArray
+        for _, instance_data in records:
+            for counter, value in instance_data.items():
+                if counter in labels and not isinstance(value, LabeledArray):
+                    instance_data[counter] = LabeledArray.parse(
+                        labels[counter], value)
+
+    def get_arrays(self, kind, instances, metrics=None):
+        '''Return ({counter: ArrayColumn}, instance_time) for the array
+           counters of kind (all of them when metrics is None), each
+           parsed once into a single array for bulk totals and
+           percentiles.'''
+        info = self.get_info(kind)
+        if metrics is None:
+            metrics = sorted(name for name in info if info[name][5])
+        labels = {}
+        for name in metrics:
+            if name in info and info[name][5]:
+                labels[self.names.counter(name)] = info[name][5]
+        if not labels:
+            # An empty metrics list would fetch every counter.
+            return {}, None
+        records = dict((counter, []) for counter in labels)
+        instance_time = None
+        for name, instance_data, instance_time in self.__iter_metrics(
+                kind, instances, metrics):
+            for counter in labels:
+                if counter in instance_data:
+                    records[counter].append((name, instance_data[counter]))
+        from netapp_metrics.arrays import ArrayColumn
+        columns = dict(
+            (counter, ArrayColumn.from_strings(
+                counter, labels[counter], records[counter], instance_time))
+            for counter in labels)
+        return columns, instance_time
+
+    def get_rates(self, kind, instances, metrics=[]):
+        '''Return ({instance: {counter: value}}, instance_time) with
+           every counter computed according to its get_info properties
+           (raw, delta, rate, average or percent) against the previous
+           call for the same kind.  Counters needing a previous sample
+           are missing from the first call.  Base counters of the
+           requested counters are collected as well.'''
+        info = self.get_info(kind)
+        if metrics:
+            metrics = list(metrics)
+            for metric in list(metrics):
+                base = metric in info and info[metric][2]
+                if base and base not in metrics:
+                    metrics.append(base)
+        frame = self.get_frame(kind, instances, metrics)
+        computed = self.rates.compute_frame(self.device, kind, info, frame)
+        return computed, frame.timestamp
+
+    def get_frame(self, kind, instances, metrics=[]):
+        '''Columnar variant of get_metrics returning a MetricFrame with
+           the filer timestamp as its single poll timestamp.'''
+        from netapp_metrics.columnar import MetricFrame
+        return MetricFrame.from_records(
+            self.iter_metrics(kind, instances, metrics))
 
 
 # EOF
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import time
+
+
+class AdaptivePager:
+    '''Records per page for the perf iterators, tuned per device, object
+       kind and call.
+
+       After each page the per-record latency and size are used to
+       estimate how many records fit in target_latency seconds and
+       target_bytes bytes.  The page size moves towards that estimate,
+       at most doubling or halving per page, and stays within minimum
+       and maximum.  The latency of a short last page is mostly the
+       fixed cost of a call, so only its size is used, and it can only
+       shrink the page size.  Tuned sizes are kept in memory and, when
+       path is set, loaded from a JSON file on creation and saved to it
+       as soon as a size moved by save_factor from its saved value,
+       otherwise at most every save_interval seconds while sizes
+       change, and at exit.'''
+
+    def __init__(self, minimum=100, maximum=10000, target_latency=2.0,
+                 target_bytes=8 << 20, path=None, save_interval=60,
+                 save_factor=1.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.target_bytes = target_bytes
+        self.path = path
+        self.save_interval = save_interval
+        self.save_factor = save_factor
+        self._sizes = {}
+        self._saved = {}
+        self._saved_at = time.time()
+        import threading
+        self._lock = threading.Lock()
+        if path is not None:
+            import atexit
+            self.load()
+            atexit.register(self.save)
+
+    def _clamp(self, size):
+        return int(max(self.minimum, min(self.maximum, size)))
+
+    def size(self, device, kind, api, default):
+        '''Return the page size to request next.'''
+        return self._sizes.get((device, kind, api), self._clamp(default))
+
+    def observe(self, device, kind, api, requested, returned, latency,
+                response_bytes=None):
+        '''Feed back a page of returned records fetched in latency
+           seconds; response_bytes is optional.'''
+        if not returned or latency <= 0:
+            return
+        estimates = []
+        if returned >= requested:
+            estimates.append(self.target_latency * returned / latency)
+        if response_bytes:
+            estimates.append(self.target_bytes * returned / response_bytes)
+        if not estimates:
+            return
+        ideal = min(estimates)
+        if returned < requested:
+            ideal = min(ideal, requested)
+        size = max(requested / 2.0, min(requested * 2.0, ideal))
+        key = (device, kind, api)
+        with self._lock:
+            size = self._sizes[key] = self._clamp(size)
+        if self.path is not None and self._save_due(key, size):
+            self.save()
+
+    def _save_due(self, key, size):
+        saved = self._saved.get(key)
+        if saved is None or max(size, saved) >= \
+                min(size, saved) * self.save_factor:
+            return True
+        return size != saved and \
+            time.time() - self._saved_at >= self.save_interval
+
+    def forget(self, device=None):
+        with self._lock:
+            for key in list(self._sizes):
+                if device in (None, key[0]):
+                    del self._sizes[key]
+
+    def load(self):
+        import json
+        try:
+            with open(self.path) as sizes:
+                data = json.load(sizes)
+        except (IOError, OSError, ValueError):
+            return
+        with self._lock:
+            for device, kind, api, size in data:
+                self._sizes[(device, kind, api)] = self._clamp(size)
+            self._saved = dict(self._sizes)
+
+    def save(self):
+        import json
+        import threading
+        with self._lock:
+            data = [list(key) + [size] for key, size in self._sizes.items()]
+            self._saved = dict(self._sizes)
+            self._saved_at = time.time()
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmpname = '%s.%d.%d.tmp' % (
+                self.path, os.getpid(), threading.current_thread().ident)
+            with open(tmpname, 'w') as sizes:
+                json.dump(data, sizes)
+            os.rename(tmpname, self.path)
+        except (IOError, OSError):
+            pass
+
+
+# EOF
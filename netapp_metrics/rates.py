@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import time
+
+RAW = 'raw'
+DELTA = 'delta'
+RATE = 'rate'
+AVERAGE = 'average'
+PERCENT = 'percent'
+COUNTER_TYPES = (RAW, DELTA, RATE, AVERAGE, PERCENT)
+
+
+def counter_type(properties):
+    '''Return the computation type named in a get_info properties
+       string such as "rate" or "delta,no-zero-values", or None.'''
+    for prop in properties.split(','):
+        prop = prop.strip()
+        if prop in COUNTER_TYPES:
+            return prop
+    return None
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # Missing, string and array counters
+        return None
+
+
+def _delta(current, previous):
+    return [
+        c - p if c is not None and p is not None and c >= p else None
+        for c, p in zip(current, previous)
+    ]
+
+
+class _Sample:
+    __slots__ = ('instances', 'index', 'timestamp', 'columns')
+
+    def __init__(self, instances, timestamp, columns):
+        self.instances = instances
+        self.index = dict((name, i) for i, name in enumerate(instances))
+        self.timestamp = timestamp
+        self.columns = columns
+
+
+class RateCalculator:
+    '''Turn raw get_metrics samples into rates, deltas, averages and
+       percentages according to the counter properties and base
+       counters reported by get_info.
+
+       The previous sample of every (device, object) is kept and each
+       counter is processed as a column over all instances of the
+       object, so a poll costs one pass per counter rather than per
+       instance and counter.  Values needing a previous sample are
+       omitted on the first poll, for new instances and when a counter
+       went backwards (wrap or reset).
+
+       With a SampleHistory every sample is recorded in it as well, and
+       the first sample of a (device, object) after a restart is
+       compared with the last one recorded, so rates resume at once.'''
+
+    def __init__(self, include_hidden=False, history=None):
+        self.include_hidden = include_hidden
+        self.history = history
+        self._previous = {}
+        import threading
+        self._lock = threading.Lock()
+
+    def _swap(self, device, kind, current):
+        '''Keep current as the previous sample of (device, kind) and
+           return the one it replaces.'''
+        with self._lock:
+            previous = self._previous.get((device, kind))
+            self._previous[(device, kind)] = current
+        if self.history is not None:
+            if previous is None:
+                found = self.history.previous(
+                    device, kind, current.instances, list(current.columns),
+                    current.timestamp)
+                if found is not None:
+                    previous = _Sample(current.instances, *found)
+            self.history.record(device, kind, current.timestamp,
+                                current.instances, current.columns)
+        return previous
+
+    def _plan(self, info, counters):
+        plan = []
+        for counter in counters:
+            if counter not in info:
+                continue
+            properties = info[counter][1]
+            ctype = counter_type(properties)
+            if ctype is None:
+                continue
+            if 'no-display' in properties and not self.include_hidden:
+                continue
+            base = info[counter][2] or None
+            if ctype in (AVERAGE, PERCENT) and base not in counters:
+                continue
+            plan.append((counter, ctype, base))
+        return plan
+
+    def _previous_column(self, previous, align, counter):
+        column = previous.columns.get(counter)
+        if column is None:
+            return [None] * len(align)
+        return [column[j] if j is not None else None for j in align]
+
+    def compute_columns(self, device, kind, info, metrics,
+                        instance_time=None):
+        '''Return (instances, {counter: [value or None, ...]}) with the
+           computed value of every counter aligned to instances.'''
+        if instance_time is None:
+            instance_time = time.time()
+        instances = list(metrics)
+        counters = set()
+        for instance_data in metrics.values():
+            counters.update(instance_data)
+        columns = {}
+        for counter in counters:
+            columns[counter] = [
+                _number(metrics[name].get(counter)) for name in instances
+            ]
+        current = _Sample(instances, instance_time, columns)
+        previous = self._swap(device, kind, current)
+        return instances, self._compute(info, current, previous)
+
+    def compute_frame(self, device, kind, info, frame):
+        '''Like compute for a MetricFrame, reading its columns directly.'''
+        timestamp = frame.timestamp
+        if timestamp is None:
+            timestamp = time.time()
+        columns = {}
+        for counter in frame.counters:
+            columns[counter] = [
+                v if v == v else None for v in frame.column(counter)
+            ]
+        current = _Sample(list(frame.instances), timestamp, columns)
+        previous = self._swap(device, kind, current)
+        return self._result(
+            current.instances, self._compute(info, current, previous))
+
+    def _compute(self, info, current, previous):
+        elapsed = None
+        align = None
+        if previous is not None:
+            elapsed = current.timestamp - previous.timestamp
+            align = [previous.index.get(name) for name in current.instances]
+        deltas = {}
+
+        def delta(counter):
+            if counter not in deltas:
+                deltas[counter] = _delta(
+                    current.columns[counter],
+                    self._previous_column(previous, align, counter))
+            return deltas[counter]
+
+        computed = {}
+        for counter, ctype, base in self._plan(info, current.columns):
+            if ctype == RAW:
+                computed[counter] = current.columns[counter]
+                continue
+            if previous is None:
+                continue
+            if ctype == DELTA:
+                computed[counter] = delta(counter)
+            elif ctype == RATE:
+                if elapsed <= 0:
+                    continue
+                computed[counter] = [
+                    d / elapsed if d is not None else None
+                    for d in delta(counter)
+                ]
+            else:
+                scale = 100.0 if ctype == PERCENT else 1.0
+                computed[counter] = [
+                    scale * d / b if d is not None and b else None
+                    for d, b in zip(delta(counter), delta(base))
+                ]
+        return computed
+
+    def compute(self, device, kind, info, metrics, instance_time=None):
+        '''Return {instance: {counter: value}} for a get_metrics sample
+           of kind on device; info is the get_info(kind) result.'''
+        return self._result(*self.compute_columns(
+            device, kind, info, metrics, instance_time))
+
+    def _result(self, instances, computed):
+        result = dict((name, {}) for name in instances)
+        for counter, column in computed.items():
+            for name, value in zip(instances, column):
+                if value is not None:
+                    result[name][counter] = value
+        return result
+
+    def reset(self, device=None, kind=None):
+        with self._lock:
+            for key in list(self._previous):
+                if device in (None, key[0]) and kind in (None, key[1]):
+                    del self._previous[key]
+
+
+# EOF
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import math
+import threading
+import time
+
+
+class Subscription:
+    '''A standing get_metrics request registered with a PollScheduler.
+
+       counters and instances may be empty or None for all of them;
+       due is the next poll time on the filer clock.'''
+
+    def __init__(self, kind, counters, interval, callback, instances=None,
+                 filter='', errback=None):
+        self.kind = kind
+        self.counters = frozenset(counters or ())
+        self.interval = interval
+        self.callback = callback
+        self.instances = None if instances is None else frozenset(instances)
+        self.filter = filter
+        self.errback = errback
+        self.due = None
+        self.polls = 0
+        self.error = None
+
+
+class PollScheduler:
+    '''Polls one device on behalf of any number of subscribers.
+
+       Subscriptions due in the same tick are merged per object kind
+       into a single get_metrics call for the union of their instances
+       and counters (all counters if any of them asks for all), and
+       every subscriber gets back the subset it asked for.  Ticks fall
+       on multiples of each interval on the filer clock, as read from
+       the timestamp of the last response, so subscriptions whose
+       intervals divide each other poll together.  Subscriptions due
+       within slack seconds of a tick are collected with it.
+
+       Callbacks are called as callback(metrics, times, instance_time)
+       like the result of get_metrics; the dicts may be shared between
+       subscribers and must not be modified.'''
+
+    def __init__(self, netapp, slack=1.0):
+        self.netapp = netapp
+        self.slack = slack
+        self.offset = 0.0
+        self.polls = 0
+        self._subscriptions = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._running = False
+
+    def _filer_time(self, now=None):
+        return (time.time() if now is None else now) + self.offset
+
+    def _next_due(self, interval, after):
+        '''First multiple of interval past after, both on the filer
+           clock.'''
+        return (math.floor(after / interval + 1e-9) + 1) * interval
+
+    def subscribe(self, kind, counters, interval, callback, instances=None,
+                  filter='', errback=None):
+        '''Poll counters of kind every interval seconds; instances None
+           polls the cached instance list of filter.  errback(exception)
+           is called when a poll fails.'''
+        subscription = Subscription(kind, counters, interval, callback,
+                                    instances, filter, errback)
+        subscription.due = self._next_due(interval, self._filer_time())
+        with self._lock:
+            self._subscriptions.append(subscription)
+        self._wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    @property
+    def subscriptions(self):
+        return list(self._subscriptions)
+
+    def next_wait(self, now=None):
+        '''Seconds until the next subscription is due, or None.'''
+        with self._lock:
+            if not self._subscriptions:
+                return None
+            due = min(s.due for s in self._subscriptions)
+        return max(0.0, due - self._filer_time(now))
+
+    def tick(self, now=None):
+        '''Poll every subscription that is due and return the number of
+           get_metrics calls made.'''
+        filer_now = self._filer_time(now) + self.slack
+        with self._lock:
+            due = [s for s in self._subscriptions if s.due <= filer_now]
+        groups = {}
+        for subscription in due:
+            groups.setdefault(subscription.kind, []).append(subscription)
+        for kind, subscriptions in groups.items():
+            self._poll(kind, subscriptions)
+        return len(groups)
+
+    def _request(self, kind, subscriptions):
+        '''Return the merged instances and counters of subscriptions and
+           the instances each of them wants, in normalized names.'''
+        instances = set()
+        counters = set()
+        all_counters = False
+        wanted = []
+        for subscription in subscriptions:
+            if subscription.instances is None:
+                requested = self.netapp.get_cached_instances(
+                    kind, subscription.filter).instances
+            else:
+                requested = subscription.instances
+            instances.update(requested)
+            wanted.append(
+                set(self.netapp.names.instance(i) for i in requested))
+            if subscription.counters:
+                counters.update(subscription.counters)
+            else:
+                all_counters = True
+        return (sorted(instances), [] if all_counters else sorted(counters),
+                wanted)
+
+    def _select(self, subscription, wanted, values, times):
+        '''Cut the part of a merged result a subscription asked for.'''
+        values = dict((k, v) for k, v in values.items() if k in wanted)
+        times = dict((k, v) for k, v in times.items() if k in wanted)
+        if subscription.counters:
+            names = self.netapp.names
+            counters = set(names.counter(c) for c in subscription.counters)
+            values = dict(
+                (k, dict((c, v) for c, v in data.items() if c in counters))
+                for k, data in values.items())
+        return values, times
+
+    def _poll(self, kind, subscriptions):
+        try:
+            instances, counters, wanted = self._request(kind, subscriptions)
+            values, times, instance_time = self.netapp.get_metrics(
+                kind, instances, counters)
+        except Exception as e:
+            after = self._filer_time()
+            for subscription in subscriptions:
+                subscription.due = self._next_due(
+                    subscription.interval, max(after, subscription.due))
+                subscription.error = e
+                if subscription.errback is not None:
+                    self._call(subscription.errback, e)
+            return
+        self.polls += 1
+        if instance_time is not None:
+            self.offset = instance_time - time.time()
+        after = self._filer_time()
+        for subscription, instances in zip(subscriptions, wanted):
+            subscription.due = self._next_due(
+                subscription.interval, max(after, subscription.due))
+            subscription.polls += 1
+            subscription.error = None
+            selected, selected_times = self._select(
+                subscription, instances, values, times)
+            self._call(subscription.callback,
+                       selected, selected_times, instance_time)
+
+    def _call(self, callback, *args):
+        try:
+            callback(*args)
+        except Exception:
+            # A broken subscriber must not stop the others.
+            pass
+
+    def _run(self):
+        while self._running:
+            wait = self.next_wait()
+            if wait is None or wait > 0:
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+                continue
+            self.tick()
+
+    def start(self):
+        '''Poll in a daemon thread until stop() is called.'''
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# EOF
@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import threading
+import time
+
+from xml.sax.saxutils import quoteattr
+
+try:
+    from xml.etree.cElementTree import fromstring
+except ImportError:
+    from xml.etree.ElementTree import fromstring
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from netapp_metrics.transport import ZAPI_NAMESPACE
+
+HISTOGRAM_LABELS = (
+    '<2us', '<6us', '<10us', '<14us', '<20us', '<40us', '<60us', '<80us',
+    '<100us', '<200us', '<400us', '<600us', '<800us', '<1ms', '<2ms',
+    '<4ms', '<6ms', '<8ms', '<10ms', '<12ms', '<14ms', '<16ms', '<18ms',
+    '<20ms', '<40ms', '<60ms', '<80ms', '<100ms', '<200ms', '<400ms',
+    '<600ms', '<800ms', '<1s', '<2s', '<4s', '<6s', '<8s', '<10s', '<20s',
+    '>20s',
+)
+
+# name, properties, unit, base counter
+BASE_COUNTERS = (
+    ('total_ops', 'rate', 'per_sec', ''),
+    ('avg_latency', 'average', 'microsec', 'total_ops'),
+    ('busy', 'percent', 'percent', 'base_time'),
+    ('base_time', 'delta,no-display', 'none', ''),
+    ('instance_count', 'raw', 'none', ''),
+    ('latency_hist', 'delta', 'none', ''),
+)
+
+
+def _name(elem):
+    return elem.tag.rsplit('}', 1)[-1]
+
+
+def _text(elem, name, default=None):
+    for child in elem:
+        if _name(child) == name:
+            return child.text
+    return default
+
+
+def _children(elem, name):
+    for child in elem:
+        if _name(child) == name:
+            return [item.text for item in child]
+    return []
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        response = self.server.simulator.handle(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ZapiSimulator:
+    '''Local stand-in for a filer's ZAPI HTTP endpoint.
+
+       Answers the calls NetAppMetrics makes (version, perf object,
+       counter and instance listing, perf-object-get-instances in both
+       C-mode and 7-mode flavours and the lun/volume/aggregate
+       inventory calls with next-tag and desired-attributes) from
+       synthetic data of configurable size.  Counter values grow with
+       the filer timestamp so consecutive polls produce rates.  Every
+       response is delayed by latency seconds, and calls, bytes_in and
+       bytes_out count what went over the wire.
+
+           with ZapiSimulator(clustered=False, instances=10000) as sim:
+               netapp = NetAppMetrics('127.0.0.1', 'user', 'pw',
+                                      port=sim.port)'''
+
+    def __init__(self, clustered=True, instances=1000, counters=20,
+                 volumes=1000, luns=None, aggregates=None, latency=0.0,
+                 objects=('volume', 'lun', 'aggregate'), host='127.0.0.1',
+                 port=0, version=(8, 3, 1)):
+        self.clustered = clustered
+        self.instances = instances
+        self.volumes = volumes
+        self.luns = volumes if luns is None else luns
+        self.aggregates = aggregates or max(1, volumes // 100)
+        self.latency = latency
+        self.objects = tuple(objects)
+        self.version = version
+        self.counters = list(BASE_COUNTERS)
+        for i in range(max(0, counters - len(BASE_COUNTERS))):
+            self.counters.append(('counter_%03d' % i, 'rate', 'per_sec', ''))
+        self.counter_index = dict(
+            (counter[0], i) for i, counter in enumerate(self.counters))
+        self.lock = threading.Lock()
+        self.iterators = {}
+        self.next_tag = 0
+        self.started = time.time()
+        self.reset_stats()
+        self._server = _Server((host, port), _Handler)
+        self._server.simulator = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self.lock:
+            self.calls = {}
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    # Data
+
+    def timestamp(self):
+        return int(time.time())
+
+    def instance_name(self, i):
+        return 'vol%06d' % i
+
+    def instance_uuid(self, i):
+        return 'node1:kernel:vol%06d' % i
+
+    def counter_value(self, instance, counter, timestamp):
+        name = self.counters[counter][0]
+        tick = int((timestamp - self.started) * 10) + 1000
+        if name == 'instance_count':
+            return str(self.instances)
+        if name == 'latency_hist':
+            return ','.join(
+                str(tick * (instance + 1) // (bucket + 1))
+                for bucket in range(len(HISTOGRAM_LABELS)))
+        return str(tick * (instance + 1) * (counter + 1))
+
+    # Responses
+
+    def _results(self, body, status='passed', reason=None):
+        attrs = "status='%s'" % status
+        if reason:
+            attrs += " errno='13005' reason=%s" % quoteattr(reason)
+        return (
+            "<?xml version='1.0' encoding='UTF-8' ?>"
+            "<netapp version='1.15' xmlns='%s'><results %s>%s</results>"
+            "</netapp>" % (ZAPI_NAMESPACE, attrs, body)
+        ).encode('utf-8')
+
+    def handle(self, body):
+        if self.latency:
+            time.sleep(self.latency)
+        request = None
+        for elem in fromstring(body):
+            request = elem
+        api = _name(request)
+        handler = getattr(self, 'api_' + api.replace('-', '_'), None)
+        if handler is None:
+            response = self._results(
+                '', 'failed', 'Unable to find API: %s' % api)
+        else:
+            try:
+                response = self._results(handler(request))
+            except (KeyError, ValueError) as e:
+                response = self._results('', 'failed', str(e))
+        with self.lock:
+            self.calls[api] = self.calls.get(api, 0) + 1
+            self.bytes_in += len(body)
+            self.bytes_out += len(response)
+        return response
+
+    def _new_tag(self, value):
+        with self.lock:
+            self.next_tag += 1
+            tag = 'tag%d' % self.next_tag
+            self.iterators[tag] = value
+        return tag
+
+    def api_system_get_version(self, request):
+        generation, major, minor = self.version
+        return (
+            '<is-clustered>%s</is-clustered>'
+            '<version>NetApp Release %d.%d.%d: simulated</version>'
+            '<version-tuple><system-version-tuple>'
+            '<generation>%d</generation><major>%d</major><minor>%d</minor>'
+            '</system-version-tuple></version-tuple>'
+        ) % ('true' if self.clustered else 'false', generation, major,
+             minor, generation, major, minor)
+
+    def api_perf_object_list_info(self, request):
+        return '<objects>%s</objects>' % ''.join(
+            '<object-info><name>%s</name><description>%s</description>'
+            '<privilege-level>basic</privilege-level></object-info>'
+            % (name, name) for name in self.objects)
+
+    def api_perf_object_counter_list_info(self, request):
+        if _text(request, 'objectname') not in self.objects:
+            raise KeyError('Object not found')
+        parts = []
+        for name, properties, unit, base in self.counters:
+            parts.append(
+                '<counter-info><name>%s</name><desc>%s</desc>'
+                '<properties>%s</properties><unit>%s</unit>'
+                '<privilege-level>basic</privilege-level>' % (
+                    name, name, properties, unit))
+            if base:
+                parts.append('<base-counter>%s</base-counter>' % base)
+            if name == 'latency_hist':
+                parts.append('<labels><label-info>%s</label-info></labels>'
+                             % ','.join(HISTOGRAM_LABELS).replace('<', '&lt;')
+                             .replace('>', '&gt;'))
+            parts.append('</counter-info>')
+        return '<counters>%s</counters>' % ''.join(parts)
+
+    def api_perf_object_instance_list_info_iter(self, request):
+        maximum = int(_text(request, 'max-records', 999))
+        start = int(_text(request, 'tag', None) or 0)
+        end = min(self.instances, start + maximum)
+        body = ''.join(
+            '<instance-info><name>%s</name><uuid>%s</uuid></instance-info>'
+            % (self.instance_name(i), self.instance_uuid(i))
+            for i in range(start, end))
+        body = '<attributes-list>%s</attributes-list>' \
+            '<num-records>%d</num-records>' % (body, end - start)
+        if end < self.instances:
+            body += '<next-tag>%d</next-tag>' % end
+        return body
+
+    def api_perf_object_instance_list_info_iter_start(self, request):
+        tag = self._new_tag([0, list(range(self.instances))])
+        return '<records>%d</records><tag>%s</tag>' % (self.instances, tag)
+
+    def api_perf_object_instance_list_info_iter_next(self, request):
+        position, indexes = self.iterators[_text(request, 'tag')]
+        maximum = int(_text(request, 'maximum', 999))
+        page = indexes[position:position + maximum]
+        self.iterators[_text(request, 'tag')][0] = position + len(page)
+        return '<instances>%s</instances><records>%d</records>' % (''.join(
+            '<instance-info><name>%s</name></instance-info>'
+            % self.instance_name(i) for i in page), len(page))
+
+    def api_perf_object_instance_list_info_iter_end(self, request):
+        self.iterators.pop(_text(request, 'tag'), None)
+        return ''
+
+    def _lookup_instances(self, names, prefix):
+        if not names:
+            return list(range(self.instances))
+        indexes = []
+        for name in names:
+            index = int(name[len(prefix):])
+            if 0 <= index < self.instances:
+                indexes.append(index)
+        return indexes
+
+    def _counter_indexes(self, request):
+        names = _children(request, 'counters')
+        if not names:
+            return list(range(len(self.counters)))
+        return [self.counter_index[name] for name in names
+                if name in self.counter_index]
+
+    def _instance_data(self, indexes, counters, timestamp):
+        parts = []
+        for i in indexes:
+            parts.append(
+                '<instance-data><name>%s</name>' % self.instance_name(i))
+            if self.clustered:
+                parts.append('<uuid>%s</uuid>' % self.instance_uuid(i))
+            parts.append('<counters>')
+            for c in counters:
+                parts.append(
+                    '<counter-data><name>%s</name><value>%s</value>'
+                    '</counter-data>' % (
+                        self.counters[c][0],
+                        self.counter_value(i, c, timestamp)))
+            parts.append('</counters></instance-data>')
+        return ''.join(parts)
+
+    def api_perf_object_get_instances(self, request):
+        uuids = _children(request, 'instance-uuids')
+        indexes = self._lookup_instances(uuids, self.instance_uuid(0)[:-6])
+        timestamp = self.timestamp()
+        return '<instances>%s</instances><timestamp>%d</timestamp>' % (
+            self._instance_data(
+                indexes, self._counter_indexes(request), timestamp),
+            timestamp)
+
+    def api_perf_object_get_instances_iter_start(self, request):
+        names = _children(request, 'instances')
+        indexes = self._lookup_instances(names, 'vol')
+        timestamp = self.timestamp()
+        tag = self._new_tag(
+            [0, indexes, self._counter_indexes(request), timestamp])
+        return '<records>%d</records><tag>%s</tag>' \
+            '<timestamp>%d</timestamp>' % (len(indexes), tag, timestamp)
+
+    def api_perf_object_get_instances_iter_next(self, request):
+        iterator = self.iterators[_text(request, 'tag')]
+        position, indexes, counters, timestamp = iterator
+        maximum = int(_text(request, 'maximum', 999))
+        page = indexes[position:position + maximum]
+        iterator[0] = position + len(page)
+        return '<instances>%s</instances><records>%d</records>' % (
+            self._instance_data(page, counters, timestamp), len(page))
+
+    def api_perf_object_get_instances_iter_end(self, request):
+        self.iterators.pop(_text(request, 'tag'), None)
+        return ''
+
+    # Inventory
+
+    def lun_record(self, i):
+        return {
+            'lun-info': [
+                ('path', '/vol/vol%06d/lun0' % i), ('size', str(i << 30)),
+                ('size-used', str(i << 20)), ('online', 'true'),
+                ('mapped', 'true'), ('vserver', 'svm1'),
+                ('uuid', 'lun-%06d' % i),
+            ]
+        }
+
+    def volume_record(self, i):
+        record = {
+            'volume-attributes': [
+                ('volume-id-attributes', [
+                    ('name', 'vol%06d' % i), ('owning-vserver-name', 'svm1'),
+                    ('uuid', 'volume-%06d' % i),
+                    ('containing-aggregate-name',
+                     'aggr%d' % (i % self.aggregates)),
+                ]),
+                ('volume-space-attributes', [
+                    ('size-total', str(i << 30)), ('size-used', str(i << 20)),
+                    ('size-available', str((i << 30) - (i << 20))),
+                    ('percentage-size-used', str(i % 100)),
+                ]),
+                ('volume-state-attributes', [
+                    ('state', 'online'), ('is-inconsistent', 'false'),
+                ]),
+            ]
+        }
+        if i % 20 == 19:
+            # Only some volumes are clones
+            record['volume-attributes'].append(
+                ('volume-clone-attributes', [
+                    ('volume-clone-parent-attributes', [
+                        ('name', 'vol%06d' % (i - 1)),
+                    ]),
+                ]))
+        return record
+
+    def aggregate_record(self, i):
+        return {
+            'aggr-attributes': [
+                ('aggregate-name', 'aggr%d' % i),
+                ('aggr-space-attributes', [
+                    ('size-total', str(i << 40)), ('size-used', str(i << 30)),
+                    ('size-available', str((i << 40) - (i << 30))),
+                ]),
+                ('aggr-raid-attributes', [
+                    ('state', 'online'), ('disk-count', '24'),
+                    ('raid-type', 'raid_dp'),
+                ]),
+            ]
+        }
+
+    def _serialize(self, name, value, desired):
+        if desired is not None and name not in desired:
+            return ''
+        if not isinstance(value, list):
+            return '<%s>%s</%s>' % (name, value, name)
+        if desired is not None:
+            desired = desired[name] or None
+        return '<%s>%s</%s>' % (name, ''.join(
+            self._serialize(child, item, desired)
+            for child, item in value), name)
+
+    def _desired(self, request):
+        for elem in request:
+            if _name(elem) == 'desired-attributes':
+                def tree(node):
+                    return dict((_name(c), tree(c)) for c in node)
+                return tree(elem)
+        return None
+
+    def _inventory(self, request, record, count):
+        desired = self._desired(request)
+        maximum = int(_text(request, 'max-records', 20))
+        start = int(_text(request, 'tag', None) or 0)
+        end = min(count, start + maximum)
+        parts = []
+        for i in range(start, end):
+            for name, value in record(i).items():
+                parts.append(self._serialize(name, value, desired))
+        body = '<attributes-list>%s</attributes-list>' \
+            '<num-records>%d</num-records>' % (''.join(parts), end - start)
+        if end < count:
+            body += '<next-tag>%d</next-tag>' % end
+        return body
+
+    def _inventory_7mode(self, container, record, count):
+        parts = []
+        for i in range(count):
+            for name, value in record(i).items():
+                name = {'volume-attributes': 'volume-info',
+                        'aggr-attributes': 'aggr-info'}.get(name, name)
+                parts.append(self._serialize(name, value, None))
+        return '<%s>%s</%s>' % (container, ''.join(parts), container)
+
+    def api_lun_get_iter(self, request):
+        return self._inventory(request, self.lun_record, self.luns)
+
+    def api_volume_get_iter(self, request):
+        return self._inventory(request, self.volume_record, self.volumes)
+
+    def api_aggr_get_iter(self, request):
+        return self._inventory(
+            request, self.aggregate_record, self.aggregates)
+
+    def api_lun_list_info(self, request):
+        return self._inventory_7mode('luns', self.lun_record, self.luns)
+
+    def api_volume_list_info(self, request):
+        return self._inventory_7mode(
+            'volumes', self.volume_record, self.volumes)
+
+    def api_aggr_list_info(self, request):
+        return self._inventory_7mode(
+            'aggregates', self.aggregate_record, self.aggregates)
+
+
+# EOF
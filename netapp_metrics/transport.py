@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+# coding=utf-8
+#
+# (c) 2015, Jason Y. Lee <jylee@cs.ucr.edu>
+#
+# This plugin/program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import base64
+import errno
+import select
+import socket
+import ssl
+import threading
+import time
+
+from contextlib import contextmanager
+
+from netapp_metrics.instrument import CallRecord, api_name, record_count
+from xml.sax.saxutils import quoteattr
+
+try:
+    from xml.etree.cElementTree import fromstring
+except ImportError:
+    from xml.etree.ElementTree import fromstring
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+try:
+    RemoteDisconnected = httplib.RemoteDisconnected
+except AttributeError:
+    RemoteDisconnected = None
+
+ZAPI_URL = '/servlets/netapp.servlets.admin.XMLrequest_filer'
+ZAPI_NAMESPACE = 'http://www.netapp.com/filer/admin'
+PING = '<system-get-version/>'
+
+_STALE_ERRNOS = (errno.EPIPE, errno.ECONNRESET, errno.ECONNABORTED)
+
+
+def _stale(error):
+    '''True for errors of a connection the filer closed while it was
+       idle, which are safe to retry: the request cannot have been
+       processed.  Timeouts never are.'''
+    if isinstance(error, socket.timeout):
+        return False
+    if RemoteDisconnected is not None:
+        if isinstance(error, RemoteDisconnected):
+            return True
+    elif isinstance(error, httplib.BadStatusLine):
+        # Python 2 reports a connection closed without any response
+        # as an empty status line.
+        return error.line in ('', "''")
+    return getattr(error, 'errno', None) in _STALE_ERRNOS
+
+
+def _dropped(connection):
+    '''True when the other end closed an idle connection.'''
+    sock = connection.sock
+    if sock is None:
+        return True
+    try:
+        # An idle connection must have nothing to read; EOF or stray
+        # data both mean it cannot be reused.
+        return bool(select.select([sock], [], [], 0)[0])
+    except (ValueError, socket.error, select.error):
+        return True
+
+
+def _name(elem):
+    return elem.tag.rsplit('}', 1)[-1]
+
+
+def to_naelement(elem, element_class):
+    '''Convert an ElementTree element into an NaElement tree.'''
+    node = element_class(_name(elem))
+    for key, value in elem.attrib.items():
+        node.attr_set(key, value)
+    if len(elem):
+        for child in elem:
+            node.child_add(to_naelement(child, element_class))
+    elif elem.text:
+        node.set_content(elem.text)
+    return node
+
+
+class ZapiTransport:
+    '''Minimal ZAPI client that hands back the raw response body.
+
+       NaServer parses every response into an NaElement tree before
+       returning it; this transport sends the same request envelope
+       (LOGIN style authentication, vserver tunneling) but lets the
+       caller parse the body itself, e.g. incrementally.
+
+       Connections are HTTP/1.1 keep-alive and reused: up to pool_size
+       idle connections are kept, connections idle for more than
+       max_idle seconds are replaced.  An idle connection is checked
+       before reuse: one the filer closed is dropped, and one idle for
+       more than check_after seconds must first answer a
+       system-get-version (check_after None skips that).  A request on
+       a reused connection that fails because the filer had closed it
+       (reset, broken pipe, closed without any response) is sent again
+       once on a fresh connection; other errors, timeouts included,
+       are raised since the filer may have processed the request.
+       With block set, at most pool_size requests are in flight at
+       once.  The transport is safe to share between threads.
+
+       When observer is set it is called with a CallRecord for every
+       call, with the time split into building the request, waiting
+       for the response and reading/parsing it.'''
+
+    def __init__(self, device, user, password, method='HTTP', port=None,
+                 timeout=None, vserver='', version=(1, 15), pool_size=1,
+                 keep_alive=True, max_idle=30, block=False,
+                 element_class=None, observer=None, check_after=10):
+        self.device = device
+        self.method = method.upper()
+        if port is None:
+            port = 443 if self.method == 'HTTPS' else 80
+        self.port = int(port)
+        self.timeout = timeout
+        self.vserver = vserver
+        self.version = version
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.element_class = element_class
+        self.observer = observer
+        self.connections_made = 0
+        self.connections_dropped = 0
+        self.health_checks = 0
+        self.retries = 0
+        credentials = ('%s:%s' % (user, password)).encode('utf-8')
+        self._auth = 'Basic %s' % base64.b64encode(credentials).decode('ascii')
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = None
+        if block:
+            self._slots = threading.BoundedSemaphore(pool_size)
+
+    def envelope(self, cmd):
+        '''Return the request body for an NaElement (or XML string).'''
+        if hasattr(cmd, 'toEncodedString'):
+            cmd = cmd.toEncodedString()
+        vfiler = ''
+        if self.vserver:
+            vfiler = ' vfiler=%s' % quoteattr(self.vserver)
+        body = (
+            "<?xml version='1.0' encoding='utf-8' ?>"
+            "<!DOCTYPE netapp SYSTEM 'file:/etc/netapp_filer.dtd'>"
+            "<netapp version='%d.%d' xmlns='%s'%s>%s</netapp>"
+        ) % (self.version[0], self.version[1], ZAPI_NAMESPACE, vfiler, cmd)
+        return body.encode('utf-8')
+
+    def headers(self, body):
+        return {
+            'Authorization': self._auth,
+            'Content-Type': 'text/xml; charset="UTF-8"',
+            'Content-Length': str(len(body)),
+            'Connection': 'keep-alive' if self.keep_alive else 'close',
+        }
+
+    def _connection(self):
+        self.connections_made += 1
+        if self.method == 'HTTPS':
+            # NaServer does not verify filer certificates either.
+            context = ssl._create_unverified_context()
+            return httplib.HTTPSConnection(
+                self.device, self.port, timeout=self.timeout,
+                context=context)
+        return httplib.HTTPConnection(
+            self.device, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        '''Return (connection, reused).'''
+        if self._slots is not None:
+            self._slots.acquire()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, last_used = self._idle.pop()
+            idle = time.time() - last_used
+            healthy = idle <= self.max_idle and not _dropped(connection)
+            if healthy and self.check_after is not None and \
+                    idle > self.check_after:
+                self.health_checks += 1
+                healthy = self._probe(connection)
+            if healthy:
+                return connection, True
+            self.connections_dropped += 1
+            connection.close()
+        return self._connection(), False
+
+    def _probe(self, connection):
+        '''Send system-get-version on connection and return True when
+           it answered and can be used again.'''
+        body = self.envelope(PING)
+        try:
+            connection.request('POST', ZAPI_URL, body, self.headers(body))
+            response = connection.getresponse()
+            data = response.read()
+        except (httplib.HTTPException, socket.error):
+            return False
+        if response.status != 200 or response.will_close:
+            return False
+        return self._passed(data)
+
+    def _passed(self, body):
+        try:
+            results = fromstring(body)
+        except Exception:
+            return False
+        return all(
+            elem.get('status') == 'passed'
+            for elem in results if _name(elem) == 'results')
+
+    def _release(self, connection, reusable):
+        try:
+            if reusable and self.keep_alive:
+                with self._lock:
+                    if len(self._idle) < self.pool_size:
+                        self._idle.append((connection, time.time()))
+                        return
+            connection.close()
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def _send(self, connection, reused, body):
+        try:
+            connection.request('POST', ZAPI_URL, body, self.headers(body))
+            return connection, connection.getresponse()
+        except (httplib.HTTPException, socket.error) as e:
+            if not reused or not _stale(e):
+                connection.close()
+                raise
+        # The filer closed the idle connection before reading the
+        # request, so it is safe to send it again.
+        self.retries += 1
+        connection.close()
+        connection = self._connection()
+        try:
+            connection.request('POST', ZAPI_URL, body, self.headers(body))
+            return connection, connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+
+    def _check(self, response):
+        if response.status != 200:
+            raise IOError('%s: HTTP %d %s' % (
+                self.device, response.status, response.reason))
+
+    def _observe(self, cmd, started, sent, answered, done, request_bytes,
+                 response_bytes, records, error):
+        self.observer(CallRecord(
+            api_name(cmd), self.device, started, sent - started,
+            answered - sent if answered else None,
+            done - answered if answered else None,
+            done - started, request_bytes, response_bytes, records, error))
+
+    @contextmanager
+    def stream(self, cmd):
+        '''Send cmd and yield the file-like response body.  Set
+           response.records before leaving the block to have it
+           reported to the observer.'''
+        started = time.time()
+        body = self.envelope(cmd)
+        sent = time.time()
+        answered = None
+        response = None
+        error = None
+        connection, reused = self._acquire()
+        reusable = False
+        try:
+            connection, response = self._send(connection, reused, body)
+            answered = time.time()
+            self._check(response)
+            yield response
+            # Drain what the caller did not read to reuse the connection.
+            response.read()
+            reusable = not response.will_close
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            raise
+        finally:
+            self._release(connection, reusable)
+            if self.observer is not None:
+                size = None
+                if response is not None and response.getheader(
+                        'Content-Length'):
+                    size = int(response.getheader('Content-Length'))
+                self._observe(
+                    cmd, started, sent, answered, time.time(), len(body),
+                    size, getattr(response, 'records', None), error)
+
+    def request(self, cmd):
+        '''Send cmd and return the raw response body.'''
+        with self.stream(cmd) as response:
+            return response.read()
+
+    def parse(self, body):
+        '''Return the results NaElement of a raw response body.'''
+        for elem in fromstring(body):
+            if _name(elem) == 'results':
+                return to_naelement(elem, self.element_class)
+        raise ValueError('%s: no results in ZAPI response' % self.device)
+
+    def invoke_elem(self, cmd):
+        '''NaServer.invoke_elem work-alike over pooled connections.'''
+        started = time.time()
+        request = self.envelope(cmd)
+        sent = time.time()
+        answered = None
+        body = None
+        res = None
+        error = None
+        connection, reused = self._acquire()
+        reusable = False
+        try:
+            connection, response = self._send(connection, reused, request)
+            self._check(response)
+            body = response.read()
+            reusable = not response.will_close
+            answered = time.time()
+            res = self.parse(body)
+            if res.results_errno():
+                error = res.results_reason()
+            return res
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            raise
+        finally:
+            self._release(connection, reusable)
+            if self.observer is not None:
+                self._observe(
+                    cmd, started, sent, answered, time.time(), len(request),
+                    None if body is None else len(body),
+                    None if res is None else record_count(res), error)
+
+    def ping(self):
+        '''Health check, True when the filer answers a ZAPI call.'''
+        try:
+            return self._passed(self.request(PING))
+        except Exception:
+            return False
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
+
+
+# EOF
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Test double of the NetApp OnTAP API library (NaServer module).
+
+Only the parts of NaElement and NaServer that netapp_metrics uses are
+here: NaElement trees built and read through the element dict, and an
+NaServer that posts the request envelope to a ZAPI endpoint such as
+ZapiSimulator over plain HTTP.  install() hands the real library to
+netapp_metrics when it can be imported and this module otherwise, so
+the tests run in a plain checkout.
+'''
+
+import base64
+import sys
+
+try:
+    from urllib.request import Request, urlopen
+except ImportError:
+    from urllib2 import Request, urlopen
+
+try:
+    from xml.etree.cElementTree import fromstring
+except ImportError:
+    from xml.etree.ElementTree import fromstring
+
+from xml.sax.saxutils import escape, quoteattr
+
+import netapp_metrics.netapp_metrics
+
+from netapp_metrics.transport import to_naelement
+
+
+class NaElement:
+
+    def __init__(self, name, content=None):
+        self.element = {
+            'name': name, 'content': '' if content is None else str(content),
+            'children': [], 'attrkeys': [], 'attrvals': [],
+        }
+
+    def child_add(self, child):
+        self.element['children'].append(child)
+
+    def child_add_string(self, name, value):
+        self.child_add(NaElement(name, value))
+
+    def children_get(self):
+        return self.element['children']
+
+    def has_children(self):
+        return 1 if self.element['children'] else 0
+
+    def child_get(self, name):
+        for child in self.element['children']:
+            if child.element['name'] == name:
+                return child
+        return None
+
+    def child_get_string(self, name):
+        child = self.child_get(name)
+        return None if child is None else child.element['content']
+
+    def set_content(self, content):
+        self.element['content'] = content
+
+    def attr_set(self, key, value):
+        self.element['attrkeys'].append(key)
+        self.element['attrvals'].append(value)
+
+    def attr_get(self, key):
+        for name, value in zip(self.element['attrkeys'],
+                               self.element['attrvals']):
+            if name == key:
+                return value
+        return None
+
+    def results_status(self):
+        return self.attr_get('status')
+
+    def results_errno(self):
+        if self.attr_get('status') == 'passed':
+            return 0
+        return self.attr_get('errno') or 1
+
+    def results_reason(self):
+        return self.attr_get('reason')
+
+    def toEncodedString(self):
+        attrs = ''.join(
+            ' %s=%s' % (key, quoteattr(value)) for key, value in
+            zip(self.element['attrkeys'], self.element['attrvals']))
+        return '<%s%s>%s%s</%s>' % (
+            self.element['name'], attrs, escape(self.element['content']),
+            ''.join(c.toEncodedString() for c in self.element['children']),
+            self.element['name'])
+
+
+class NaServer:
+
+    def __init__(self, server, major, minor):
+        self.server = server
+        self.major = major
+        self.minor = minor
+        self.port = 80
+        self.timeout = None
+        self.vserver = ''
+        self.user = None
+        self.password = None
+
+    def set_transport_type(self, transport):
+        if transport != 'HTTP':
+            raise ValueError('only HTTP is supported')
+
+    def set_style(self, style):
+        pass
+
+    def set_admin_user(self, user, password):
+        self.user = user
+        self.password = password
+
+    def set_port(self, port):
+        self.port = int(port)
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def set_vserver(self, vserver):
+        self.vserver = vserver
+
+    def invoke_elem(self, cmd):
+        vfiler = ' vfiler=%s' % quoteattr(self.vserver) if self.vserver \
+            else ''
+        body = (
+            "<?xml version='1.0' encoding='utf-8' ?>"
+            "<netapp version='%d.%d' "
+            "xmlns='http://www.netapp.com/filer/admin'%s>%s</netapp>"
+        ) % (self.major, self.minor, vfiler, cmd.toEncodedString())
+        request = Request(
+            'http://%s:%d/servlets/netapp.servlets.admin.XMLrequest_filer' % (
+                self.server, self.port), body.encode('utf-8'))
+        credentials = ('%s:%s' % (self.user, self.password)).encode('utf-8')
+        request.add_header(
+            'Authorization',
+            'Basic ' + base64.b64encode(credentials).decode('ascii'))
+        response = urlopen(request, timeout=self.timeout)
+        try:
+            root = fromstring(response.read())
+        finally:
+            response.close()
+        return to_naelement(root[0], NaElement)
+
+    _invoke_elem = invoke_elem
+
+    def invoke(self, api, *args):
+        cmd = NaElement(api)
+        for name, value in zip(args[::2], args[1::2]):
+            cmd.child_add_string(name, value)
+        return self.invoke_elem(cmd)
+
+
+def install():
+    '''Point netapp_metrics at the NetApp library, or at this module when
+       the library cannot be imported, and return the module used.'''
+    try:
+        import NaServer as module
+    except ImportError:
+        module = sys.modules[__name__]
+    netapp_metrics.netapp_metrics.NaServer = module
+    return module
+
+
+# EOF
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Histogram bucket bounds, percentiles and deltas of array counters.'''
+
+import math
+import unittest
+
+from netapp_metrics.arrays import (
+    INF, ArrayColumn, LabeledArray, _percentile, label_bounds, parse_array)
+
+LABELS = ['<20us', '<1ms', '<1s', '>1s']
+
+
+class LabelBoundsTest(unittest.TestCase):
+
+    def test_buckets(self):
+        self.assertEqual(label_bounds(LABELS), [
+            (0.0, 20.0), (20.0, 1000.0), (1000.0, 1000000.0),
+            (1000000.0, INF)])
+
+    def test_units(self):
+        self.assertEqual(label_bounds(['<500ns', '< 2 us', '>20s']), [
+            (0.0, 0.5), (0.5, 2.0), (20000000.0, INF)])
+
+    def test_not_buckets(self):
+        self.assertIsNone(label_bounds(['nfs', 'cifs', 'iscsi']))
+        self.assertIsNone(label_bounds(['<20us', 'other']))
+
+
+class PercentileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bounds = label_bounds(LABELS)
+
+    def test_interpolated(self):
+        values = parse_array('10,10,0,0')
+        self.assertEqual(_percentile(values, 0, 4, self.bounds, 50), 20.0)
+        self.assertEqual(_percentile(values, 0, 4, self.bounds, 25), 10.0)
+        self.assertEqual(_percentile(values, 0, 4, self.bounds, 75), 510.0)
+
+    def test_open_bucket(self):
+        # Counts in the >1s bucket report its lower bound.
+        values = parse_array('1,0,0,9')
+        self.assertEqual(
+            _percentile(values, 0, 4, self.bounds, 99), 1000000.0)
+
+    def test_open_bucket_from_labels(self):
+        bounds = label_bounds(['<1s', '<20s', '>20s'])
+        values = parse_array('0,0,5')
+        self.assertEqual(_percentile(values, 0, 3, bounds, 50), 20000000.0)
+
+    def test_empty(self):
+        self.assertIsNone(
+            _percentile(parse_array('0,0,0,0'), 0, 4, self.bounds, 50))
+        self.assertIsNone(
+            _percentile(parse_array(''), 0, 0, self.bounds, 50))
+        self.assertIsNone(
+            _percentile(parse_array(',,', 4), 0, 4, self.bounds, 50))
+
+    def test_row_offset(self):
+        values = parse_array('0,0,0,4,10,10,0,0')
+        self.assertEqual(_percentile(values, 4, 8, self.bounds, 50), 20.0)
+
+    def test_labeled_array(self):
+        self.assertEqual(LabeledArray.parse(LABELS, '10,10,0,0')
+                         .percentile(50), 20.0)
+        self.assertIsNone(LabeledArray.parse(['a', 'b'], '1,2')
+                          .percentile(50))
+
+
+class DeltaTest(unittest.TestCase):
+
+    def column(self, records, timestamp):
+        return ArrayColumn.from_strings('latency_hist', LABELS, records,
+                                        timestamp)
+
+    def test_delta(self):
+        previous = self.column(
+            [('a', '1,2,3,4'), ('b', '5,5,5,5'), ('gone', '1,1,1,1')], 100)
+        current = self.column(
+            [('b', '6,7,8,9'), ('a', '2,2,1,4'), ('new', '1,1,1,1')], 160)
+        delta = current.delta(previous)
+        self.assertEqual(delta.instances, ('b', 'a'))
+        self.assertEqual(delta.timestamp, 160)
+        self.assertEqual(list(delta.row('b').values), [1.0, 2.0, 3.0, 4.0])
+        row = list(delta.row('a').values)
+        self.assertEqual(row[:2], [1.0, 0.0])
+        # Went backwards (counter reset)
+        self.assertTrue(math.isnan(row[2]))
+        self.assertEqual(row[3], 0.0)
+        self.assertEqual(list(delta.totals()), [10.0, 1.0])
+
+    def test_delta_missing_values(self):
+        previous = self.column([('a', '1,2')], 100)
+        current = self.column([('a', '3,4,5,6')], 160)
+        row = list(current.delta(previous).row('a').values)
+        self.assertEqual(row[:2], [2.0, 2.0])
+        self.assertTrue(all(math.isnan(value) for value in row[2:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
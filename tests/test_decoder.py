@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Equivalence of the streaming decoder with _decode_elements2dict on
+recorded lun, volume and aggregate responses of C-mode and 7-mode.
+
+The fixtures were recorded from ZapiSimulator.  The legacy decoder is
+fed NaElement trees of the NetApp OnTAP API library when it can be
+imported and of the naserver test double otherwise.
+'''
+
+import io
+import os
+import unittest
+
+try:
+    from xml.etree.cElementTree import fromstring
+except ImportError:
+    from xml.etree.ElementTree import fromstring
+
+import naserver
+
+from netapp_metrics.decoder import RecordStream, as_filter, decode_element
+from netapp_metrics.netapp_metrics import NetAppMetrics
+from netapp_metrics.transport import to_naelement
+
+NaServer = naserver.install()
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'fixtures')
+
+# fixture, container, filter
+CASES = [
+    ('cmode-lun', 'attributes-list', ['path', 'size']),
+    ('cmode-volume', 'attributes-list', ['name', 'size-used']),
+    ('cmode-aggr', 'attributes-list', ['aggregate-name', 'size-total']),
+    ('7mode-lun', 'luns', ['path', 'size']),
+    ('7mode-volume', 'volumes', ['name', 'size-used']),
+    ('7mode-aggr', 'aggregates', ['aggregate-name', 'size-total']),
+]
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def load(fixture):
+    with open(os.path.join(FIXTURES, fixture + '.xml'), 'rb') as body:
+        return body.read()
+
+
+def results(body):
+    for elem in fromstring(body):
+        if _local(elem.tag) == 'results':
+            return elem
+    raise ValueError('no results')
+
+
+def legacy(elem, filter=None):
+    decoder = NetAppMetrics.__new__(NetAppMetrics)
+    return decoder._decode_elements2dict(
+        to_naelement(elem, NaServer.NaElement), filter)
+
+
+class DecoderEquivalenceTest(unittest.TestCase):
+
+    def check(self, fixture, container, filter):
+        body = load(fixture)
+        res = results(body)
+        records = [
+            elem for elem in res if _local(elem.tag) == container][0]
+        expected = legacy(records, filter)
+
+        stream = RecordStream(io.BytesIO(body), container, filter)
+        self.assertEqual(list(stream), expected)
+        self.assertEqual(
+            decode_element(res, as_filter(filter)), legacy(res, filter))
+        leaves = dict(
+            (_local(elem.tag), elem.text or '') for elem in res if not len(elem))
+        self.assertEqual(stream.info, leaves)
+
+    def test_unfiltered(self):
+        for fixture, container, _ in CASES:
+            self.check(fixture, container, None)
+
+    def test_filtered(self):
+        for fixture, container, filter in CASES:
+            self.check(fixture, container, filter)
+
+    def test_single_field_filter(self):
+        for fixture, container, filter in CASES:
+            self.check(fixture, container, filter[0])
+
+    def test_failed_call(self):
+        body = (
+            b"<?xml version='1.0' encoding='UTF-8' ?>"
+            b"<netapp version='1.15' xmlns='http://www.netapp.com/filer/admin'>"
+            b"<results status='failed' errno='13005' reason='no luns'/>"
+            b"</netapp>")
+        stream = RecordStream(io.BytesIO(body), 'luns', None, 'lun: %s')
+        with self.assertRaises(ValueError) as raised:
+            list(stream)
+        self.assertEqual(str(raised.exception), 'lun: no luns')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''FleetCollector bookkeeping while calls are in flight.'''
+
+import threading
+import unittest
+
+from netapp_metrics.fleet import DeviceBusy, FleetCollector
+
+
+class FleetCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.collector = FleetCollector(workers=2)
+        self.collector.add('filer', 'user', 'password')
+        # Skip connecting: calls get this object as their connection.
+        self.collector._connections['filer'] = 'connection'
+        self.started = threading.Event()
+        self.proceed = threading.Event()
+        self.results = []
+
+    def tearDown(self):
+        self.proceed.set()
+        self.collector.close()
+
+    def call(self, netapp):
+        self.started.set()
+        self.proceed.wait(10)
+        return netapp
+
+    def start(self):
+        def consume():
+            self.results.extend(self.collector.map(self.call))
+        worker = threading.Thread(target=consume)
+        worker.daemon = True
+        worker.start()
+        self.assertTrue(self.started.wait(10))
+        return worker
+
+    def finish(self, worker):
+        self.proceed.set()
+        worker.join(10)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(len(self.results), 1)
+        self.assertEqual(self.results[0].device, 'filer')
+        self.assertEqual(self.results[0].value, 'connection')
+        self.assertIsNone(self.results[0].error)
+
+    def test_remove_during_call(self):
+        worker = self.start()
+        self.collector.remove('filer')
+        self.finish(worker)
+
+    def test_add_again_during_call(self):
+        worker = self.start()
+        self.collector.add('filer', 'user', 'password')
+        self.finish(worker)
+        # The new registration starts with a free slot.
+        self.assertTrue(self.collector._limits['filer'].acquire(False))
+
+    def test_busy(self):
+        worker = self.start()
+        busy = list(self.collector.map(self.call))
+        self.assertEqual(len(busy), 1)
+        self.assertIsInstance(busy[0].error, DeviceBusy)
+        self.finish(worker)
+
+
+if __name__ == '__main__':
+    unittest.main()
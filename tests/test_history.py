@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''SampleHistory lookups, eviction and reopening.'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from netapp_metrics.history import SampleHistory
+
+
+class PlacedHistory(SampleHistory):
+    '''Counters are numbers used as their fingerprint, so tests choose
+       the slot every key starts probing at.'''
+
+    def _fingerprint(self, prefix, counter):
+        return int(counter)
+
+
+class HistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'history')
+        self.histories = []
+
+    def tearDown(self):
+        for history in self.histories:
+            history.close()
+        shutil.rmtree(self.directory)
+
+    def open(self, cls=SampleHistory, **kwargs):
+        history = cls(self.path, **kwargs)
+        self.histories.append(history)
+        return history
+
+    def test_ring(self):
+        history = self.open(depth=3)
+        for timestamp in (100, 110, 120, 130):
+            history.append('filer', 'volume', 'vol0', 'ops', timestamp,
+                           timestamp * 2)
+        # The same poll again replaces the newest sample
+        history.append('filer', 'volume', 'vol0', 'ops', 130, 1.0)
+        self.assertEqual(history.samples('filer', 'volume', 'vol0', 'ops'),
+                         [(110, 220), (120, 240), (130, 1.0)])
+        self.assertIsNone(history.last('filer', 'volume', 'vol1', 'ops'))
+
+    def test_warm_reopen(self):
+        history = self.open(keys=5000)
+        history.record('filer', 'volume', 100.0, ['vol0', 'vol1'],
+                       {'ops': [1.0, 2.0], 'latency': [None, 5.0]})
+        history.close()
+        history = self.open(keys=5000)
+        self.assertEqual(history.last('filer', 'volume', 'vol1', 'latency'),
+                         (100.0, 5.0))
+        self.assertIsNone(history.last('filer', 'volume', 'vol0', 'latency'))
+
+    def test_reopen_resized(self):
+        history = self.open(keys=5000)
+        history.append('filer', 'volume', 'vol0', 'ops', 100.0, 1.0)
+        history.close()
+        history = self.open(keys=40000)
+        self.assertEqual(history.slots, 65536)
+        self.assertEqual(history.samples('filer', 'volume', 'vol0', 'ops'),
+                         [])
+        self.assertEqual(os.path.getsize(self.path), history.size)
+
+    def test_eviction(self):
+        history = self.open(PlacedHistory, keys=100, probes=2)
+        self.assertEqual(history.slots, 1024)
+        # Three keys starting at slot 5 share the slots 5 and 6.
+        first, second, third, fourth = '5', '1029', '2053', '3077'
+        history.append('filer', 'volume', 'vol0', first, 100.0, 1.0)
+        history.append('filer', 'volume', 'vol0', second, 110.0, 2.0)
+        self.assertEqual(history.evictions, 0)
+        history.append('filer', 'volume', 'vol0', third, 120.0, 3.0)
+        self.assertEqual(history.evictions, 1)
+        self.assertIsNone(history.last('filer', 'volume', 'vol0', first))
+        self.assertEqual(history.last('filer', 'volume', 'vol0', third),
+                         (120.0, 3.0))
+        # The least recently written key goes, not the oldest one.
+        history.append('filer', 'volume', 'vol0', second, 130.0, 4.0)
+        history.append('filer', 'volume', 'vol0', fourth, 140.0, 5.0)
+        self.assertIsNone(history.last('filer', 'volume', 'vol0', third))
+        self.assertEqual(history.samples('filer', 'volume', 'vol0', second),
+                         [(110.0, 2.0), (130.0, 4.0)])
+        self.assertEqual(history.samples('filer', 'volume', 'vol0', fourth),
+                         [(140.0, 5.0)])
+        # Evicted keys are not remembered.
+        self.assertEqual(len(history._offsets), 2)
+
+    def test_probe_limit(self):
+        history = self.open(PlacedHistory, keys=100, probes=2)
+        history.append('filer', 'volume', 'vol0', '5', 100.0, 1.0)
+        history.append('filer', 'volume', 'vol0', '6', 100.0, 1.0)
+        # Slot 7 is free but out of reach of a key starting at 5.
+        history.append('filer', 'volume', 'vol0', '1029', 110.0, 2.0)
+        self.assertEqual(history.evictions, 1)
+        self.assertEqual(history.last('filer', 'volume', 'vol0', '1029'),
+                         (110.0, 2.0))
+
+    def test_full_table(self):
+        history = self.open(keys=100, probes=4)
+        instances = ['vol%d' % i for i in range(3 * history.slots)]
+        for start in range(0, len(instances), 256):
+            history.record('filer', 'volume', float(start),
+                           instances[start:start + 256],
+                           {'ops': [1.0] * 256})
+        self.assertGreater(history.evictions, 0)
+        self.assertLessEqual(len(history._offsets), history.slots)
+        self.assertEqual(history.last('filer', 'volume', instances[-1],
+                                      'ops'), (float(len(instances) - 256),
+                                               1.0))
+
+    def test_previous(self):
+        history = self.open()
+        history.record('filer', 'volume', 100.0, ['vol0', 'vol1'],
+                       {'ops': [1.0, 2.0]})
+        history.record('filer', 'volume', 110.0, ['vol0', 'vol1'],
+                       {'ops': [3.0, 4.0]})
+        history.record('filer', 'volume', 120.0, ['vol0'], {'ops': [5.0]})
+        instances = ['vol0', 'vol1', 'vol2']
+        self.assertEqual(
+            history.previous('filer', 'volume', instances, ['ops']),
+            (120.0, {'ops': [5.0, None, None]}))
+        self.assertEqual(
+            history.previous('filer', 'volume', instances, ['ops'], 120.0),
+            (110.0, {'ops': [3.0, 4.0, None]}))
+        self.assertEqual(
+            history.previous('filer', 'volume', instances, ['ops'], 105.0),
+            (100.0, {'ops': [1.0, 2.0, None]}))
+        self.assertIsNone(
+            history.previous('filer', 'volume', instances, ['ops'], 100.0))
+        self.assertIsNone(
+            history.previous('filer', 'aggregate', instances, ['ops']))
+
+
+if __name__ == '__main__':
+    unittest.main()
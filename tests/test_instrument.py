@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Instrumentation counters under concurrent records.'''
+
+import sys
+import threading
+import unittest
+
+from netapp_metrics.instrument import CallRecord, Instrumentation
+
+
+def call(error=None):
+    return CallRecord('perf-object-get-instances', 'filer', 0.0, 0.001,
+                      0.002, 0.003, 0.006, 100, 2048, 10, error)
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def test_concurrent_records(self):
+        instrumentation = Instrumentation()
+        threads = 8
+        calls = 2000
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            workers = [
+                threading.Thread(target=lambda: [
+                    instrumentation.record(call(i % 4 == 0 or None))
+                    for i in range(calls)])
+                for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            sys.setswitchinterval(interval)
+        total = threads * calls
+        stats = instrumentation.stats('filer', 'perf-object-get-instances')
+        self.assertEqual(stats.calls, total)
+        self.assertEqual(stats.errors, total // 4)
+        self.assertEqual(stats.records, total * 10)
+        self.assertEqual(stats.response_bytes, total * 2048)
+        self.assertEqual(stats.total_time.count, total)
+        self.assertEqual(stats.response_size.count, total)
+
+    def test_self_metrics(self):
+        instrumentation = Instrumentation()
+        instrumentation.record(call())
+        instrumentation.record(call('failed'))
+        metrics = instrumentation.self_metrics()
+        base = 'netapp_metrics.filer.perf-object-get-instances'
+        self.assertEqual(metrics[base + '.calls'], 2)
+        self.assertEqual(metrics[base + '.errors'], 1)
+        self.assertEqual(metrics[base + '.records'], 20)
+        self.assertEqual(metrics[base + '.response_bytes'], 4096)
+        self.assertEqual(metrics[base + '.total_time.max'], 0.006)
+        self.assertEqual(instrumentation.last().error, 'failed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''Projected (desired-attributes) inventory calls against ZapiSimulator
+return the same records as the unprojected call they learned from.
+Uses the NetApp OnTAP API library when it can be imported and the
+naserver test double otherwise.'''
+
+import unittest
+
+import naserver
+
+from netapp_metrics.netapp_metrics import NetAppMetrics
+from netapp_metrics.simulator import ZapiSimulator
+
+naserver.install()
+
+
+class ProjectionTest(unittest.TestCase):
+
+    pool_size = 1
+
+    def connect(self):
+        return NetAppMetrics(
+            self.simulator.host, 'user', 'password',
+            port=self.simulator.port, schema_cache=False, pager=False,
+            pool_size=self.pool_size)
+
+    def setUp(self):
+        self.simulator = ZapiSimulator(volumes=60, luns=60, aggregates=30)
+        self.simulator.start()
+        self.netapp = self.connect()
+
+    def tearDown(self):
+        self.netapp.close()
+        self.simulator.stop()
+
+    def check(self, method, filter, page_size):
+        reference = self.connect()
+        reference._desired_attributes = lambda api, filter: None
+        self.simulator.reset_stats()
+        unprojected = getattr(reference, method)(filter, page_size)
+        unprojected_bytes = self.simulator.bytes_out
+        reference.close()
+        learned = getattr(self.netapp, method)(filter, page_size)
+        self.assertEqual(learned, unprojected)
+        self.simulator.reset_stats()
+        projected = getattr(self.netapp, method)(filter, page_size)
+        self.assertEqual(projected, unprojected)
+        self.assertLess(self.simulator.bytes_out, unprojected_bytes)
+
+    def test_volumes(self):
+        # Every 20th volume has volume-clone-attributes, so with pages
+        # of 10 the first page does not show every container.
+        self.check('get_vol_space_info', ['name', 'size-used'], 10)
+
+    def test_luns(self):
+        self.check('get_lun_info', ['path', 'size'], 25)
+
+    def test_aggregates(self):
+        self.check('get_aggr_info', 'size-total', None)
+
+
+class UnpooledProjectionTest(ProjectionTest):
+    '''The same calls through NaServer instead of the pooled
+       transport.'''
+
+    pool_size = None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''AdaptivePager tuning and the page size limits of NetAppMetrics.'''
+
+import unittest
+
+from netapp_metrics.netapp_metrics import NetAppMetrics
+from netapp_metrics.paging import AdaptivePager
+
+
+def poll(pager, records, fixed, per_record):
+    '''Page through records with a fixed per call latency.'''
+    remaining = records
+    while remaining:
+        requested = pager.size('filer', 'volume', 'iter', 999)
+        returned = min(requested, remaining)
+        remaining -= returned
+        pager.observe('filer', 'volume', 'iter', requested, returned,
+                      fixed + per_record * returned)
+    return pager.size('filer', 'volume', 'iter', 999)
+
+
+class AdaptivePagerTest(unittest.TestCase):
+
+    def test_converges_with_fixed_call_cost(self):
+        pager = AdaptivePager()
+        sizes = [poll(pager, 5000, 1.2, 0.0002) for _ in range(10)]
+        # 2.0s target: (2.0 - 1.2) / 0.0002 records per page
+        self.assertEqual(sizes, sorted(sizes))
+        self.assertLessEqual(sizes[-1], 4000)
+        self.assertGreater(sizes[-1], 3800)
+
+    def test_short_page_latency_ignored(self):
+        pager = AdaptivePager()
+        pager.observe('filer', 'volume', 'iter', 1000, 10, 1.5)
+        self.assertEqual(pager.size('filer', 'volume', 'iter', 1000), 1000)
+
+    def test_short_page_bytes_shrink(self):
+        pager = AdaptivePager(target_bytes=1000)
+        pager.observe('filer', 'volume', 'iter', 1000, 10, 1.5, 100)
+        self.assertEqual(pager.size('filer', 'volume', 'iter', 1000), 500)
+
+    def test_bounds(self):
+        pager = AdaptivePager(minimum=100, maximum=2000)
+        self.assertEqual(pager.size('filer', 'volume', 'iter', 50), 100)
+        for _ in range(5):
+            pager.observe('filer', 'volume', 'iter', 2000, 2000, 0.01)
+        self.assertEqual(pager.size('filer', 'volume', 'iter', 999), 2000)
+
+
+class PageSizeTest(unittest.TestCase):
+
+    def netapp(self, max_records, pager):
+        netapp = NetAppMetrics.__new__(NetAppMetrics)
+        netapp.device = 'filer'
+        netapp.max_records = max_records
+        netapp.perf_max_records = 999 if max_records is None else max_records
+        netapp.pager = pager
+        return netapp
+
+    def test_tuned_by_default(self):
+        pager = AdaptivePager()
+        pager.observe('filer', 'volume', 'iter', 999, 999, 0.1)
+        netapp = self.netapp(None, pager)
+        self.assertEqual(netapp._page_size('volume', 'iter'), 1998)
+
+    def test_max_records_caps_tuning(self):
+        pager = AdaptivePager()
+        pager.observe('filer', 'volume', 'iter', 999, 999, 0.1)
+        self.assertEqual(
+            self.netapp(1200, pager)._page_size('volume', 'iter'), 1200)
+        # Below the pager minimum as well
+        self.assertEqual(
+            self.netapp(50, pager)._page_size('volume', 'iter'), 50)
+
+    def test_without_pager(self):
+        self.assertEqual(self.netapp(50, None)._page_size('volume', 'iter'),
+                         50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''RateCalculator on two hand-built get_metrics samples.'''
+
+import unittest
+
+from netapp_metrics.columnar import MetricFrame
+from netapp_metrics.rates import RateCalculator, counter_type
+
+# get_info style: (unit, properties, base, privilege, description, labels)
+INFO = {
+    'read_ops': ('per_sec', 'rate', '', 'basic', '', None),
+    'total_ops': ('per_sec', 'rate', '', 'basic', '', None),
+    'read_data': ('b', 'delta', '', 'basic', '', None),
+    'avg_latency': ('microsec', 'average', 'total_ops', 'basic', '', None),
+    'other_latency': ('microsec', 'average', 'other_ops', 'basic', '', None),
+    'cpu_busy': ('percent', 'percent', 'cpu_elapsed_time', 'basic', '',
+                 None),
+    'cpu_elapsed_time': ('none', 'delta,no-display', '', 'basic', '', None),
+    'size': ('b', 'raw', '', 'basic', '', None),
+    'vserver_name': ('none', 'string', '', 'basic', '', None),
+}
+
+FIRST = {
+    'vol0': {'read_ops': '100', 'total_ops': '50', 'read_data': '1000',
+             'avg_latency': '5000', 'other_latency': '10',
+             'cpu_busy': '200', 'cpu_elapsed_time': '1000', 'size': '7',
+             'vserver_name': 'svm1'},
+    'vol2': {'read_ops': '100', 'total_ops': '50', 'avg_latency': '50'},
+}
+
+SECOND = {
+    'vol0': {'read_ops': '150', 'total_ops': '56', 'read_data': '1500',
+             'avg_latency': '5600', 'other_latency': '20',
+             'cpu_busy': '300', 'cpu_elapsed_time': '1200', 'size': '8',
+             'vserver_name': 'svm1'},
+    # New instance: raw values only
+    'vol1': {'read_ops': '10', 'size': '3'},
+    # read_ops wrapped, total_ops unchanged
+    'vol2': {'read_ops': '5', 'total_ops': '50', 'avg_latency': '70'},
+}
+
+EXPECTED = {
+    'vol0': {'read_ops': 5.0, 'total_ops': 0.6, 'read_data': 500.0,
+             'avg_latency': 100.0, 'cpu_busy': 50.0, 'size': 8.0},
+    'vol1': {'size': 3.0},
+    'vol2': {'total_ops': 0.0},
+}
+
+
+def frame(metrics, timestamp):
+    return MetricFrame.from_records(sorted(metrics.items()), timestamp)
+
+
+class RateCalculatorTest(unittest.TestCase):
+
+    def test_counter_type(self):
+        self.assertEqual(counter_type('rate'), 'rate')
+        self.assertEqual(counter_type('delta,no-display'), 'delta')
+        self.assertEqual(counter_type('average, no-zero-values'), 'average')
+        self.assertIsNone(counter_type('string'))
+
+    def test_first_sample_is_raw_only(self):
+        rates = RateCalculator()
+        self.assertEqual(rates.compute('filer', 'volume', INFO, FIRST, 100),
+                         {'vol0': {'size': 7.0}, 'vol2': {}})
+
+    def test_compute(self):
+        rates = RateCalculator()
+        rates.compute('filer', 'volume', INFO, FIRST, 100)
+        self.assertEqual(
+            rates.compute('filer', 'volume', INFO, SECOND, 110), EXPECTED)
+
+    def test_compute_frame(self):
+        rates = RateCalculator()
+        rates.compute_frame('filer', 'volume', INFO, frame(FIRST, 100))
+        self.assertEqual(rates.compute_frame(
+            'filer', 'volume', INFO, frame(SECOND, 110)), EXPECTED)
+
+    def test_hidden_counters(self):
+        rates = RateCalculator(include_hidden=True)
+        rates.compute('filer', 'volume', INFO, FIRST, 100)
+        computed = rates.compute('filer', 'volume', INFO, SECOND, 110)
+        self.assertEqual(computed['vol0']['cpu_elapsed_time'], 200.0)
+
+    def test_base_not_polled(self):
+        # Averages and percentages need their base counter in the sample.
+        rates = RateCalculator()
+        first = {'vol0': {'avg_latency': '10'}}
+        second = {'vol0': {'avg_latency': '20'}}
+        rates.compute('filer', 'volume', INFO, first, 100)
+        self.assertEqual(
+            rates.compute('filer', 'volume', INFO, second, 110), {'vol0': {}})
+
+    def test_no_elapsed_time(self):
+        rates = RateCalculator()
+        rates.compute('filer', 'volume', INFO, FIRST, 100)
+        computed = rates.compute('filer', 'volume', INFO, SECOND, 100)
+        self.assertNotIn('read_ops', computed['vol0'])
+        self.assertEqual(computed['vol0']['read_data'], 500.0)
+        self.assertEqual(computed['vol0']['avg_latency'], 100.0)
+
+    def test_devices_and_reset(self):
+        rates = RateCalculator()
+        rates.compute('filer', 'volume', INFO, FIRST, 100)
+        self.assertEqual(
+            rates.compute('other', 'volume', INFO, SECOND, 110)['vol0'],
+            {'size': 8.0})
+        rates.reset('filer')
+        self.assertEqual(
+            rates.compute('filer', 'volume', INFO, SECOND, 110)['vol0'],
+            {'size': 8.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
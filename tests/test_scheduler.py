@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding=utf-8
+'''PollScheduler merging of due subscriptions against a fake
+connection.'''
+
+import time
+import unittest
+
+from netapp_metrics.cache import InstanceSet
+from netapp_metrics.naming import NameNormalizer
+from netapp_metrics.scheduler import PollScheduler
+
+INSTANCES = {
+    'a': frozenset(['/vol/a1', '/vol/a2']),
+    'b': frozenset(['/vol/b1']),
+}
+COUNTERS = ['read_ops', 'total_ops', 'write_ops']
+
+
+class FakeNetApp:
+    '''Answers get_metrics with every requested counter of every
+       requested instance.'''
+
+    def __init__(self):
+        self.names = NameNormalizer('graphite')
+        self.calls = []
+
+    def get_cached_instances(self, kind, filter=''):
+        instances = INSTANCES[filter]
+        return InstanceSet(instances, instances, frozenset(), 0.0, None)
+
+    def get_metrics(self, kind, instances, metrics=[]):
+        self.calls.append((kind, list(instances), list(metrics)))
+        counters = metrics or COUNTERS
+        values = dict(
+            (self.names.instance(i),
+             dict((self.names.counter(c), 1) for c in counters))
+            for i in instances)
+        times = dict((instance, 100.0) for instance in values)
+        return values, times, 100.0
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.netapp = FakeNetApp()
+        self.scheduler = PollScheduler(self.netapp)
+        self.results = {}
+
+    def subscribe(self, name, counters, **kwargs):
+        def callback(values, times, instance_time):
+            self.results[name] = values
+        return self.scheduler.subscribe(
+            'volume', counters, 60, callback, **kwargs)
+
+    def test_filters_are_not_mixed(self):
+        self.subscribe('a', ['read_ops'], filter='a')
+        self.subscribe('b', ['write_ops'], filter='b')
+        self.assertEqual(self.scheduler.tick(now=time.time() + 120), 1)
+        self.assertEqual(self.netapp.calls, [
+            ('volume', ['/vol/a1', '/vol/a2', '/vol/b1'],
+             ['read_ops', 'write_ops'])])
+        self.assertEqual(self.results['a'], {
+            'vol.a1': {'read_ops': 1}, 'vol.a2': {'read_ops': 1}})
+        self.assertEqual(self.results['b'], {'vol.b1': {'write_ops': 1}})
+
+    def test_explicit_instances(self):
+        self.subscribe('one', ['total_ops'], instances=['/vol/a2'])
+        self.subscribe('all', None, filter='b')
+        self.scheduler.tick(now=time.time() + 120)
+        self.assertEqual(self.netapp.calls, [
+            ('volume', ['/vol/a2', '/vol/b1'], [])])
+        self.assertEqual(self.results['one'], {'vol.a2': {'total_ops': 1}})
+        self.assertEqual(self.results['all'], {
+            'vol.b1': dict((c, 1) for c in COUNTERS)})
+
+    def test_nothing_due(self):
+        self.subscribe('a', ['read_ops'], filter='a')
+        self.assertEqual(self.scheduler.tick(now=0.0), 0)
+        self.assertEqual(self.netapp.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()